@@ -5,6 +5,7 @@
 
 import { Command } from 'commander';
 import { generateQuoteEndpoint } from './index';
+import { runWorker } from './worker';
 import { GenerateEndpointRequest, SAPVersion } from './types';
 import * as fs from 'fs';
 import * as path from 'path';
@@ -123,6 +124,22 @@ program
     }
   });
 
+program
+  .command('worker')
+  .description('Run a long-lived generation worker (JSON jobs on stdin, results on stdout)')
+  .option('--idle-timeout <seconds>', 'Exit after this many seconds without a job')
+  .action(async (options) => {
+    try {
+      const idleTimeoutMs = options.idleTimeout ? parseFloat(options.idleTimeout) * 1000 : undefined;
+      await runWorker(process.stdin, process.stdout, { idleTimeoutMs });
+      process.exit(0);
+    } catch (error) {
+      console.error('\nFatal error in worker:');
+      console.error(error);
+      process.exit(1);
+    }
+  });
+
 program
   .command('init')
   .description('Initialize a new SAP project with example config files')
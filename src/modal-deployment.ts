@@ -16,97 +16,982 @@
  */
 
 import { ModalClient } from 'modal';
-import { GenerateEndpointRequest, SAPVersion } from './types';
+import express from 'express';
+import { GenerateEndpointRequest, GenerationManifest, MANIFEST_FILENAME, SAPVersion } from './types';
+import type { WorkerJob, WorkerMessage, WorkerResult } from './worker';
+import * as crypto from 'crypto';
 import * as fs from 'fs';
+import * as os from 'os';
 import * as path from 'path';
+import { Readable } from 'stream';
+import { pipeline } from 'stream/promises';
+import * as zlib from 'zlib';
+
+const MODAL_APP_NAME = 'sap-endpoint-generator';
+// Pinned base image: a floating tag like node:20-slim changes whenever
+// upstream publishes, which invalidates every cached layer built on top
+const BASE_IMAGE = 'node:20.19.5-slim';
+const CACHE_ROOT = '/output/.cache';
+// Part of every cache key - bump when the cache entry layout changes
+const CACHE_VERSION = 1;
+// Cache entries not hit for this long are removed on the next store
+const CACHE_MAX_AGE_DAYS = 30;
+const MAX_CONCURRENT_READS = 16;
+// Each remote read is a sandbox exec, so keep fewer of those in flight
+const MAX_CONCURRENT_EXECS = 8;
+// Customers of one batch generating side by side, each on its own worker
+const MAX_BATCH_WORKERS = 8;
+// A worker with no job for this long exits (see runWorker), letting its
+// sandbox go idle; the margin keeps clients off workers about to stop
+const WORKER_IDLE_TIMEOUT_MS = 2 * 60 * 1000;
+const WORKER_IDLE_MARGIN_MS = 30 * 1000;
+// Customer names end up in volume paths and sandbox names
+const CUSTOMER_NAME_PATTERN = /^[a-z0-9_-]+$/;
 
 export interface ModalGenerationOptions {
-  timeout?: number; // Sandbox timeout in milliseconds (default: 30 minutes)
-  idleTimeout?: number; // Auto-terminate after inactivity (default: 5 minutes)
+  timeout?: number; // Max time for one generation in milliseconds (default: 30 minutes)
+  idleTimeout?: number; // Auto-terminate after inactivity (default: 10 minutes)
+  maxLifetime?: number; // Absolute lifetime of a warm sandbox (default: 2 hours)
   verbose?: boolean; // Enable verbose logging
   volumeName?: string; // Custom volume name for output
+  keepWarm?: boolean; // Keep the sandbox running for reuse until idle timeout (default: true)
+  force?: boolean; // Regenerate even if identical inputs are cached on the volume
+  onLog?: (line: string) => void; // Called with each line of generation output
+  signal?: AbortSignal; // Cancel the generation, e.g. when the client disconnects
 }
 
+type ModalApp = Awaited<ReturnType<ModalClient['apps']['fromName']>>;
+type ModalImage = ReturnType<ModalClient['images']['fromRegistry']>;
+type ModalSandbox = Awaited<ReturnType<ModalClient['sandboxes']['create']>>;
+type ModalSandboxParams = NonNullable<Parameters<ModalClient['sandboxes']['create']>[2]>;
+type ModalContainerProcess = Awaited<ReturnType<ModalSandbox['exec']>>;
+
 /**
- * Generate SAP endpoint using Modal Sandbox for isolation
+ * Reject customer names that could escape the customer's output directory
+ * or break out of a shell command
  */
-export async function generateWithModalSandbox(
+function assertValidCustomerName(customerName: string): void {
+  if (!CUSTOMER_NAME_PATTERN.test(customerName)) {
+    throw new Error(
+      `Invalid customer name: ${customerName}. Must be lowercase alphanumeric with optional underscores/hyphens.`
+    );
+  }
+}
+
+/**
+ * Map over items with at most `limit` calls in flight. Results keep the
+ * order of `items`; the first rejection rejects the whole call.
+ */
+async function mapWithConcurrency<T, R>(
+  items: T[],
+  limit: number,
+  fn: (item: T, index: number) => Promise<R>
+): Promise<R[]> {
+  const results: R[] = new Array(items.length);
+  let next = 0;
+
+  const runners = Array.from({ length: Math.min(limit, items.length) }, async () => {
+    while (next < items.length) {
+      const index = next++;
+      results[index] = await fn(items[index], index);
+    }
+  });
+
+  await Promise.all(runners);
+  return results;
+}
+
+// Sandbox env var holding its absolute deadline (epoch ms), set at creation.
+// Tags can't carry it, since setTags() replaces them on every call.
+const SANDBOX_EXPIRES_AT_ENV = 'SANDBOX_EXPIRES_AT';
+
+/**
+ * Time left before Modal kills a running sandbox at its absolute timeout,
+ * or 0 when unknown (e.g. sandboxes created without the deadline env var).
+ */
+async function remainingLifetime(sb: ModalSandbox): Promise<number> {
+  const printenv = await sb.exec(['printenv', SANDBOX_EXPIRES_AT_ENV]);
+  const expiresAt = Number((await printenv.stdout.readText()).trim());
+  if ((await printenv.wait()) !== 0 || !expiresAt) {
+    return 0;
+  }
+  return expiresAt - Date.now();
+}
+
+/**
+ * Reuse a running sandbox with the given name, or create a new one.
+ *
+ * Named sandboxes are unique per app, so a warm sandbox left running by a
+ * previous call is picked up here instead of paying the cold start again -
+ * provided it has at least `minLifetime` left, since Modal kills a sandbox
+ * at its timeout even in the middle of a generation.
+ *
+ * A new named sandbox is only created when `shared` is set. Otherwise (or
+ * when the named one is about to expire) the caller gets a fresh unnamed
+ * sandbox that it `owns` and must terminate. Named sandboxes are never
+ * owned: other calls may be running on them at any time.
+ */
+async function getOrCreateSandbox(
+  modal: ModalClient,
+  app: ModalApp,
+  image: ModalImage,
+  params: ModalSandboxParams & { timeoutMs: number },
+  options: { minLifetime: number; shared: boolean }
+): Promise<{ sandbox: ModalSandbox; reused: boolean; owned: boolean }> {
+  let expiring = false;
+  if (params.name) {
+    try {
+      const existing = await modal.sandboxes.fromName(MODAL_APP_NAME, params.name);
+      // poll() returns null while the sandbox is still running
+      if ((await existing.poll()) === null) {
+        if ((await remainingLifetime(existing)) >= options.minLifetime) {
+          return { sandbox: existing, reused: true, owned: false };
+        }
+        expiring = true;
+        console.log(`[Modal] Sandbox ${params.name} is too close to its timeout, not reusing it`);
+      }
+    } catch {
+      // No running sandbox with this name - fall through and create one
+    }
+  }
+
+  const { name, ...unnamedParams } = params;
+  const createParams = {
+    ...unnamedParams,
+    env: { ...params.env, [SANDBOX_EXPIRES_AT_ENV]: String(Date.now() + params.timeoutMs) },
+  };
+
+  if (name && options.shared && !expiring) {
+    try {
+      const sandbox = await modal.sandboxes.create(app, image, { ...createParams, name });
+      return { sandbox, reused: false, owned: false };
+    } catch (error: any) {
+      // Most likely a concurrent call created it first - run privately instead
+      console.log(`[Modal] Could not create sandbox ${name} (${error.message}), using a private one`);
+    }
+  }
+
+  const sandbox = await modal.sandboxes.create(app, image, createParams);
+  return { sandbox, reused: false, owned: true };
+}
+
+// Dockerfile RUN commands are passed to the shell as a single argument,
+// which Linux caps at 128 KiB - stay well below that per command
+const MAX_RUN_ARG_BYTES = 64 * 1024;
+
+/**
+ * Dockerfile commands that write `content` to `file` inside the image,
+ * gzipped and base64 encoded in as many RUN commands as needed.
+ */
+function writeFileCommands(file: string, content: string): string[] {
+  const encoded = zlib.gzipSync(content).toString('base64');
+  const commands: string[] = [];
+  for (let offset = 0; offset < encoded.length; offset += MAX_RUN_ARG_BYTES) {
+    const chunk = encoded.slice(offset, offset + MAX_RUN_ARG_BYTES);
+    commands.push(`RUN echo '${chunk}' ${offset === 0 ? '>' : '>>'} ${file}.gz.b64`);
+  }
+  commands.push(`RUN base64 -d ${file}.gz.b64 | gunzip > ${file} && rm ${file}.gz.b64`);
+  return commands;
+}
+
+/**
+ * Dockerfile commands that install the project's npm dependencies in their
+ * own image layer.
+ *
+ * Only the parts of package.json and package-lock.json that affect the
+ * install (plus the build script) go into the layer, so Modal's image cache
+ * keeps it until the dependencies change; editing source files, bumping the
+ * version or touching other scripts never triggers a reinstall. `npm ci`
+ * installs exactly the locked versions CI tests with. The sandbox then only
+ * has to run `npm run build`.
+ *
+ * npm never publishes lockfiles, so an installed copy of this package has
+ * none; the layer then falls back to `npm install` from package.json.
+ */
+function dependencyLayerCommands(): string[] {
+  const root = path.join(__dirname, '..');
+  const packageJson = JSON.parse(fs.readFileSync(path.join(root, 'package.json'), 'utf-8'));
+  const installManifest = {
+    name: packageJson.name,
+    private: true,
+    scripts: { build: packageJson.scripts?.build },
+    dependencies: packageJson.dependencies,
+    devDependencies: packageJson.devDependencies,
+  };
+
+  const lockPath = path.join(root, 'package-lock.json');
+  if (!fs.existsSync(lockPath)) {
+    return [
+      'WORKDIR /workspace',
+      ...writeFileCommands('package.json', JSON.stringify(installManifest)),
+      'RUN npm install --no-audit --no-fund',
+    ];
+  }
+  const packageLock = JSON.parse(fs.readFileSync(lockPath, 'utf-8'));
+
+  // Mirror the reduced manifest in the lockfile's root entry, so it stays
+  // in sync for `npm ci` and carries no version
+  const installLock = {
+    ...packageLock,
+    version: undefined,
+    packages: {
+      ...packageLock.packages,
+      '': {
+        name: packageJson.name,
+        dependencies: packageJson.dependencies,
+        devDependencies: packageJson.devDependencies,
+      },
+    },
+  };
+
+  return [
+    'WORKDIR /workspace',
+    ...writeFileCommands('package.json', JSON.stringify(installManifest)),
+    ...writeFileCommands('package-lock.json', JSON.stringify(installLock)),
+    'RUN npm ci --no-audit --no-fund',
+  ];
+}
+
+// Image ID of the built generator image, shared by all calls in this process
+let generatorImageId: Promise<string> | undefined;
+
+/**
+ * Get the generator image, building it at most once per process.
+ *
+ * The Dockerfile chain is resolved and built on the first call; later calls
+ * reuse the built image by ID instead of resubmitting the whole definition.
+ */
+async function getGeneratorImage(modal: ModalClient, app: ModalApp): Promise<ModalImage> {
+  if (!generatorImageId) {
+    generatorImageId = modal.images
+      .fromRegistry(BASE_IMAGE)
+      .dockerfileCommands([
+        // Install git (required for npm install from git repos) and clean up
+        // the apt lists in the same layer, so they never end up in the image.
+        // Node.js and npm already come with the base image.
+        'RUN apt-get update && apt-get install -y --no-install-recommends git ca-certificates' +
+          ' && rm -rf /var/lib/apt/lists/*',
+        // Install npm dependencies (cached until dependencies change)
+        ...dependencyLayerCommands(),
+      ])
+      .build(app)
+      .then((image) => image.imageId);
+
+    // Don't cache a failed build - retry on the next call
+    generatorImageId.catch(() => {
+      generatorImageId = undefined;
+    });
+  }
+
+  return modal.images.fromId(await generatorImageId);
+}
+
+/**
+ * Fallback dependency install inside the sandbox, for images built without
+ * the dependency layer.
+ */
+async function installDependencies(sb: ModalSandbox, verbose: boolean): Promise<void> {
+  // Install dependencies
+  console.log('[Modal] Installing dependencies...');
+  const npmInstall = await sb.exec(['npm', 'install'], {
+    timeoutMs: 5 * 60 * 1000, // 5 minutes for npm install
+  });
+
+  // Stream npm install output
+  if (verbose) {
+    for await (const line of npmInstall.stdout) {
+      process.stdout.write(`  [npm] ${line}`);
+    }
+  }
+
+  const installExitCode = await npmInstall.wait();
+  if (installExitCode !== 0) {
+    throw new Error(`npm install failed with exit code ${installExitCode}`);
+  }
+  console.log('[Modal] ✓ Dependencies installed');
+}
+
+// Build of each sandbox, keyed by sandbox ID, so concurrent generations in
+// one sandbox wait for a single build instead of each running npm
+const projectBuilds = new Map<string, Promise<void>>();
+
+/**
+ * Build the project unless a previous run in this sandbox already did so.
+ */
+function ensureProjectBuilt(sb: ModalSandbox, verbose: boolean): Promise<void> {
+  let build = projectBuilds.get(sb.sandboxId);
+  if (!build) {
+    build = buildProject(sb, verbose);
+    projectBuilds.set(sb.sandboxId, build);
+    // Don't cache a failed build - retry on the next call
+    build.catch(() => projectBuilds.delete(sb.sandboxId));
+  }
+  return build;
+}
+
+async function buildProject(sb: ModalSandbox, verbose: boolean): Promise<void> {
+  const check = await sb.exec(['test', '-f', 'dist/cli.js']);
+  if ((await check.wait()) === 0) {
+    console.log('[Modal] ✓ Reusing existing build');
+    return;
+  }
+
+  // Dependencies are normally baked into the image (see dependencyLayerCommands)
+  const modulesCheck = await sb.exec(['test', '-d', 'node_modules']);
+  if ((await modulesCheck.wait()) === 0) {
+    console.log('[Modal] ✓ Dependencies preinstalled in image');
+  } else {
+    await installDependencies(sb, verbose);
+  }
+
+  // Build the project
+  console.log('[Modal] Building project...');
+  const npmBuild = await sb.exec(['npm', 'run', 'build'], {
+    timeoutMs: 2 * 60 * 1000, // 2 minutes for build
+  });
+
+  const buildExitCode = await npmBuild.wait();
+  if (buildExitCode !== 0) {
+    throw new Error(`npm build failed with exit code ${buildExitCode}`);
+  }
+  console.log('[Modal] ✓ Build complete');
+}
+
+/**
+ * Forget everything cached for a sandbox that is being terminated.
+ */
+function forgetSandbox(sb: ModalSandbox): void {
+  SandboxWorker.evict(sb);
+  projectBuilds.delete(sb.sandboxId);
+}
+
+/**
+ * Flush volume writes so other sandboxes (and downloads) can see them.
+ * Volume changes are otherwise only committed when the sandbox terminates,
+ * which never happens promptly for a warm sandbox.
+ */
+async function commitVolume(sb: ModalSandbox, mountPath: string = '/output'): Promise<void> {
+  const sync = await sb.exec(['sync', mountPath]);
+  const exitCode = await sync.wait();
+  if (exitCode !== 0) {
+    throw new Error(`Failed to commit volume at ${mountPath} (exit code ${exitCode})`);
+  }
+}
+
+/**
+ * Client for a long-lived `cli.js worker` process inside a sandbox.
+ *
+ * The worker keeps Node and the SDK loaded between generations, so each job
+ * only pays for the actual agent work. Jobs are sent one at a time as JSON
+ * lines on stdin; the worker answers on stdout with the job's log lines and
+ * then its result, so no log line can arrive after the result. It exits
+ * by itself after WORKER_IDLE_TIMEOUT_MS without a job, since a running
+ * exec would otherwise keep the sandbox from ever going idle.
+ *
+ * A sandbox normally runs one worker. Batches start one per customer (see
+ * the `slot` argument of forSandbox()), so customers generate in parallel.
+ */
+class SandboxWorker {
+  // Keyed by sandbox ID and slot. Holds the start promise, so concurrent
+  // callers share one worker instead of each spawning their own.
+  private static readonly workers = new Map<string, Promise<SandboxWorker>>();
+
+  private buffer = '';
+  private readonly stdoutChunks: AsyncIterator<string>;
+  private queue: Promise<unknown> = Promise.resolve();
+  private nextJobId = 1;
+  private exited = false;
+  private pending = 0;
+  private lastActive = Date.now();
+
+  private constructor(
+    private readonly proc: ModalContainerProcess,
+    private readonly key: string
+  ) {
+    this.stdoutChunks = proc.stdout[Symbol.asyncIterator]();
+
+    // Output logged outside of jobs goes to stderr - forward it as well
+    void (async () => {
+      let partial = '';
+      for await (const chunk of proc.stderr) {
+        const lines = (partial + chunk).split('\n');
+        partial = lines.pop() ?? '';
+        lines.forEach((line) => SandboxWorker.emitLog(line));
+      }
+      SandboxWorker.emitLog(partial);
+      this.exited = true;
+    })().catch(() => undefined);
+  }
+
+  private static emitLog(line: string, onLog?: (line: string) => void): void {
+    const trimmed = line.trimEnd();
+    if (trimmed) {
+      console.log(`  ${trimmed}`);
+      onLog?.(trimmed);
+    }
+  }
+
+  /**
+   * Whether new jobs can be sent: the process is running and not about to
+   * stop on its idle timeout.
+   */
+  private isUsable(): boolean {
+    if (this.exited) {
+      return false;
+    }
+    return this.pending > 0 || Date.now() - this.lastActive < WORKER_IDLE_TIMEOUT_MS - WORKER_IDLE_MARGIN_MS;
+  }
+
+  private static key(sb: ModalSandbox, slot: string): string {
+    return `${sb.sandboxId}/${slot}`;
+  }
+
+  /**
+   * Get the running worker for a sandbox, starting one if needed. Jobs for
+   * different slots run in separate worker processes.
+   */
+  static async forSandbox(sb: ModalSandbox, slot: string = 'default'): Promise<SandboxWorker> {
+    const key = SandboxWorker.key(sb, slot);
+    const cached = SandboxWorker.workers.get(key);
+    if (cached) {
+      const worker = await cached.catch(() => undefined);
+      if (worker?.isUsable()) {
+        return worker;
+      }
+      // Failed, exited or idle - the first caller to notice replaces it
+      if (SandboxWorker.workers.get(key) === cached) {
+        SandboxWorker.workers.delete(key);
+      }
+      return SandboxWorker.forSandbox(sb, slot);
+    }
+
+    const started = sb
+      .exec(['node', 'dist/cli.js', 'worker', '--idle-timeout', String(WORKER_IDLE_TIMEOUT_MS / 1000)])
+      .then((proc) => {
+        console.log('[Modal] ✓ Generation worker started');
+        return new SandboxWorker(proc, key);
+      });
+    SandboxWorker.workers.set(key, started);
+    return started;
+  }
+
+  /**
+   * Forget the workers of a sandbox that is being terminated.
+   */
+  static evict(sb: ModalSandbox): void {
+    for (const key of SandboxWorker.workers.keys()) {
+      if (key.startsWith(`${sb.sandboxId}/`)) {
+        SandboxWorker.workers.delete(key);
+      }
+    }
+  }
+
+  /**
+   * Stop the sandbox's worker if it has no jobs left, by closing its stdin,
+   * so the sandbox's idle timeout can start right away.
+   */
+  static async release(sb: ModalSandbox): Promise<void> {
+    const key = SandboxWorker.key(sb, 'default');
+    const cached = SandboxWorker.workers.get(key);
+    const worker = await cached?.catch(() => undefined);
+    if (!worker || worker.pending > 0) {
+      return;
+    }
+
+    SandboxWorker.workers.delete(key);
+    worker.exited = true;
+    await worker.proc.stdin.close();
+  }
+
+  /**
+   * Stop sending jobs to this worker and close its stdin, so the process
+   * exits once its current job ends. forSandbox() starts a new worker on
+   * the next call. The job itself can't be interrupted - only terminating
+   * the sandbox kills it.
+   */
+  private async stop(): Promise<void> {
+    this.exited = true;
+    console.log(`[Modal] Stopping generation worker ${this.key}`);
+    await this.proc.stdin.close().catch(() => undefined);
+  }
+
+  /**
+   * Run one generation request; resolves with the session ID and the
+   * generated files (relative to the output directory). Lines the
+   * worker logs while the job runs are passed to `onLog`. A job without a
+   * result after `timeoutMs`, or whose `signal` is aborted, is rejected and
+   * the worker stopped, failing the jobs queued behind it as well.
+   */
+  generate(
+    request: GenerateEndpointRequest,
+    configContents: Record<string, string>,
+    options: { timeoutMs: number; onLog?: (line: string) => void; signal?: AbortSignal }
+  ): Promise<WorkerResult> {
+    this.pending++;
+    const run = this.queue.then(async () => {
+      try {
+        return await this.runJob(request, configContents, options);
+      } finally {
+        this.pending--;
+        this.lastActive = Date.now();
+      }
+    });
+    // Keep the queue going even if this job fails
+    this.queue = run.catch(() => undefined);
+    return run;
+  }
+
+  private async runJob(
+    request: GenerateEndpointRequest,
+    configContents: Record<string, string>,
+    options: { timeoutMs: number; onLog?: (line: string) => void; signal?: AbortSignal }
+  ): Promise<WorkerResult> {
+    if (options.signal?.aborted) {
+      throw new Error('Generation cancelled');
+    }
+    if (this.exited) {
+      throw new Error('Generation worker stopped before the job started');
+    }
+
+    const job: WorkerJob = { id: this.nextJobId++, request, configContents };
+    await this.proc.stdin.writeText(JSON.stringify(job) + '\n');
+
+    // Rejects on timeout or cancellation, after stopping the worker
+    let fail: (error: Error) => void = () => undefined;
+    const stopped = new Promise<never>((_resolve, reject) => {
+      fail = (error) => {
+        void this.stop();
+        reject(error);
+      };
+    });
+    const timer = setTimeout(
+      () => fail(new Error(`Generation timed out after ${options.timeoutMs / 1000}s`)),
+      options.timeoutMs
+    );
+    const onAbort = () => fail(new Error('Generation cancelled'));
+    options.signal?.addEventListener('abort', onAbort);
+
+    try {
+      return await Promise.race([this.receiveResult(job.id, options.onLog), stopped]);
+    } finally {
+      clearTimeout(timer);
+      options.signal?.removeEventListener('abort', onAbort);
+    }
+  }
+
+  private async receiveResult(jobId: number, onLog?: (line: string) => void): Promise<WorkerResult> {
+    let message = await this.readMessage();
+    while (message.type === 'log' && message.id === jobId) {
+      SandboxWorker.emitLog(message.line, onLog);
+      message = await this.readMessage();
+    }
+    if (message.id !== jobId || message.type === 'log') {
+      throw new Error(`Worker protocol error: expected job ${jobId}, got ${message.type} for ${message.id}`);
+    }
+    if (message.type === 'error') {
+      const logHint = message.logPath ? ` (log: /output/${message.logPath})` : '';
+      throw new Error(`Generation failed: ${message.error}${logHint}`);
+    }
+    return { sessionId: message.sessionId, files: message.files, logPath: message.logPath };
+  }
+
+  private async readMessage(): Promise<WorkerMessage> {
+    let newline = this.buffer.indexOf('\n');
+    while (newline === -1) {
+      const chunk = await this.stdoutChunks.next();
+      if (chunk.done) {
+        this.exited = true;
+        const exitCode = await this.proc.wait();
+        throw new Error(`Generation worker exited with code ${exitCode}`);
+      }
+      this.buffer += chunk.value;
+      newline = this.buffer.indexOf('\n');
+    }
+
+    const line = this.buffer.slice(0, newline);
+    this.buffer = this.buffer.slice(newline + 1);
+    return JSON.parse(line);
+  }
+}
+
+/**
+ * Serialize a value to JSON with object keys sorted, so logically equal
+ * inputs always produce the same string.
+ */
+function stableStringify(value: unknown): string {
+  if (Array.isArray(value)) {
+    return `[${value.map(stableStringify).join(',')}]`;
+  }
+  if (value && typeof value === 'object') {
+    const entries = Object.keys(value as Record<string, unknown>)
+      .sort()
+      .map((key) => `${JSON.stringify(key)}:${stableStringify((value as Record<string, unknown>)[key])}`);
+    return `{${entries.join(',')}}`;
+  }
+  return JSON.stringify(value ?? null);
+}
+
+// Version of this package, read once - generator and prompt changes ship
+// with a new version
+let generatorVersion: string | undefined;
+
+function getGeneratorVersion(): string {
+  if (generatorVersion === undefined) {
+    const packageJson = JSON.parse(fs.readFileSync(path.join(__dirname, '..', 'package.json'), 'utf-8'));
+    generatorVersion = String(packageJson.version);
+  }
+  return generatorVersion;
+}
+
+/**
+ * Read a request's config files concurrently, keyed by file name - the form
+ * both the cache key and the worker job take them in.
+ */
+async function readConfigContents(request: GenerateEndpointRequest): Promise<Record<string, string>> {
+  const contents = await mapWithConcurrency(request.configFiles, MAX_CONCURRENT_READS, (filePath) =>
+    fs.promises.readFile(filePath, 'utf-8')
+  );
+
+  const configContents: Record<string, string> = {};
+  request.configFiles.forEach((filePath, i) => {
+    configContents[path.basename(filePath)] = contents[i];
+  });
+  return configContents;
+}
+
+/**
+ * Compute the cache key for a generation request.
+ *
+ * The key covers everything that influences the generated code: customer,
+ * SAP version, config file names and contents, and the requirements. It
+ * also includes the generator version, so output cached by an older
+ * release is never served after an upgrade. Pass `configContents` when the
+ * config files were already read; otherwise they are read here.
+ */
+export function computeGenerationCacheKey(
   request: GenerateEndpointRequest,
-  options: ModalGenerationOptions = {}
-): Promise<{
+  configContents?: Record<string, string>
+): string {
+  let configFiles = configContents;
+  if (!configFiles) {
+    configFiles = {};
+    for (const filePath of request.configFiles) {
+      configFiles[path.basename(filePath)] = fs.readFileSync(filePath, 'utf-8');
+    }
+  }
+
+  return crypto
+    .createHash('sha256')
+    .update(
+      stableStringify({
+        cacheVersion: CACHE_VERSION,
+        generatorVersion: getGeneratorVersion(),
+        customerName: request.customerName,
+        sapVersion: request.sapVersion,
+        configFiles,
+        quoteFields: request.requirements.quoteFields,
+        customFields: request.requirements.customFields ?? {},
+        specialLogic: request.requirements.specialLogic ?? '',
+      })
+    )
+    .digest('hex');
+}
+
+interface CacheManifest {
+  key: string;
+  customer: string;
+  sessionId?: string;
+  files: string[];
+  createdAt: string;
+}
+
+/**
+ * Look up a cached generation on the volume. On a hit the customer's output
+ * directory is replaced by the cached files and the manifest returned; the
+ * entry is touched, so it is kept while it keeps getting hits.
+ */
+async function readCachedGeneration(
+  sb: ModalSandbox,
+  key: string,
+  customerName: string
+): Promise<CacheManifest | null> {
+  const cat = await sb.exec(['cat', `${CACHE_ROOT}/${key}/manifest.json`]);
+  const manifestText = await cat.stdout.readText();
+  if ((await cat.wait()) !== 0) {
+    return null;
+  }
+
+  let manifest: CacheManifest;
+  try {
+    manifest = JSON.parse(manifestText);
+  } catch {
+    return null;
+  }
+
+  // Start from an empty directory, so files from other inputs don't linger
+  const restore = await sb.exec([
+    'bash',
+    '-c',
+    'touch "$1" && rm -rf "/output/$2" && mkdir -p "/output/$2" && cp -a "$1/files/." "/output/$2/"',
+    'restore',
+    `${CACHE_ROOT}/${key}`,
+    customerName,
+  ]);
+  if ((await restore.wait()) !== 0) {
+    return null;
+  }
+
+  return manifest;
+}
+
+/**
+ * Copy a customer's generated output into the cache and write its manifest.
+ * The manifest is written last, so a partially copied entry is never a hit.
+ * Entries without a hit for CACHE_MAX_AGE_DAYS are removed along the way.
+ */
+async function storeCachedGeneration(
+  sb: ModalSandbox,
+  key: string,
+  customerName: string,
+  generation: WorkerResult
+): Promise<void> {
+  const manifest: CacheManifest = {
+    key,
+    customer: customerName,
+    sessionId: generation.sessionId,
+    files: generation.files,
+    createdAt: new Date().toISOString(),
+  };
+  const b64Manifest = Buffer.from(JSON.stringify(manifest, null, 2)).toString('base64');
+
+  // Paths go in as positional arguments, never into the script itself
+  const store = await sb.exec([
+    'bash',
+    '-c',
+    'rm -rf "$1" && mkdir -p "$1/files" && cp -a "/output/$2/." "$1/files/" && ' +
+      'echo "$3" | base64 -d > "$1/manifest.json" && ' +
+      '{ find "$4" -mindepth 1 -maxdepth 1 -type d -mtime "+$5" -exec rm -rf {} + || true; }',
+    'store',
+    `${CACHE_ROOT}/${key}`,
+    customerName,
+    b64Manifest,
+    CACHE_ROOT,
+    String(CACHE_MAX_AGE_DAYS),
+  ]);
+  const exitCode = await store.wait();
+  if (exitCode !== 0) {
+    // Caching is best effort - the generation itself succeeded
+    console.warn(`[Modal] Failed to cache output for ${customerName} (exit code ${exitCode})`);
+  }
+}
+
+/**
+ * Run a generation, serving it from the volume cache when the same inputs
+ * were generated before. Resumed sessions are never cached, since their
+ * output depends on the session history.
+ */
+async function runCachedGeneration(
+  sb: ModalSandbox,
+  request: GenerateEndpointRequest,
+  options: {
+    timeout: number;
+    force: boolean;
+    verbose: boolean;
+    onLog?: (line: string) => void;
+    signal?: AbortSignal;
+    workerSlot?: string;
+  }
+): Promise<WorkerResult & { cached: boolean }> {
+  assertValidCustomerName(request.customerName);
+  // Read once, for both the cache key and the job
+  const configContents = await readConfigContents(request);
+  const cacheKey = request.resume ? undefined : computeGenerationCacheKey(request, configContents);
+
+  if (cacheKey && !options.force) {
+    const manifest = await readCachedGeneration(sb, cacheKey, request.customerName);
+    if (manifest) {
+      console.log(`[Modal] ✓ Cache hit for ${request.customerName} (${cacheKey.slice(0, 12)})`);
+      return { sessionId: manifest.sessionId, files: manifest.files, cached: true };
+    }
+  }
+
+  await ensureProjectBuilt(sb, options.verbose);
+  const generation = await runGeneration(sb, request, configContents, options);
+
+  if (cacheKey) {
+    await storeCachedGeneration(sb, cacheKey, request.customerName, generation);
+  }
+
+  return { ...generation, cached: false };
+}
+
+export interface ModalGenerationResult {
   success: boolean;
   sessionId?: string;
   files?: string[];
+  logPath?: string; // Generation log on the volume, relative to its root
   sandboxId?: string;
+  cached?: boolean; // True when served from the volume cache
   error?: string;
-}> {
-  const {
-    timeout = 30 * 60 * 1000, // 30 minutes default
-    idleTimeout = 5 * 60 * 1000, // 5 minutes idle timeout
-    verbose = false,
-    volumeName = 'sap-generated-code',
-  } = options;
+}
 
-  console.log(`[Modal] Starting SAP generation for ${request.customerName}`);
+export interface ModalBatchOptions extends Omit<ModalGenerationOptions, 'keepWarm' | 'maxLifetime'> {
+  maxBatchSize?: number; // Flush once this many requests are queued (default: 8)
+  waitMs?: number; // Max time to wait for a batch to fill up (default: 2 seconds)
+}
 
-  try {
-    // 1. Initialize Modal client
-    const modal = new ModalClient();
+/**
+ * Connect to Modal and get (or create) a named generator sandbox with the
+ * project image, output volume and API key secret attached.
+ *
+ * With `keepWarm`, a new sandbox is created under `name` and lives for
+ * `maxLifetime`, so later calls can reuse it. Otherwise the call only reuses
+ * an existing warm sandbox, or gets a private one sized to `timeout`.
+ * Without a `name` the sandbox is always private. The caller must terminate
+ * the sandbox when `owned` is set - and only then.
+ */
+async function openGeneratorSandbox(
+  name: string | undefined,
+  options: Required<
+    Pick<ModalGenerationOptions, 'timeout' | 'idleTimeout' | 'maxLifetime' | 'verbose' | 'volumeName' | 'keepWarm'>
+  >
+): Promise<{ sandbox: ModalSandbox; reused: boolean; owned: boolean }> {
+  const { timeout, idleTimeout, maxLifetime, verbose, volumeName, keepWarm } = options;
+  const lifetime = keepWarm ? Math.max(timeout, maxLifetime) : timeout;
 
-    // 2. Get or create the Modal app
-    const app = await modal.apps.fromName('sap-endpoint-generator', {
-      createIfMissing: true,
-    });
-    if (verbose) {
-      console.log(`[Modal] Connected to app: ${app.appId}`);
-    }
+  // 1. Initialize Modal client
+  const modal = new ModalClient();
 
-    // 3. Define container image with Node.js and required dependencies
-    const image = modal.images
-      .fromRegistry('node:20-slim')
-      .dockerfileCommands([
-        // Install git (required for npm install from git repos)
-        'RUN apt-get update && apt-get install -y git',
-        // Install build tools
-        'RUN apt-get install -y build-essential python3',
-        // Clean up
-        'RUN rm -rf /var/lib/apt/lists/*',
-      ]);
+  // 2. Get or create the Modal app
+  const app = await modal.apps.fromName(MODAL_APP_NAME, {
+    createIfMissing: true,
+  });
+  if (verbose) {
+    console.log(`[Modal] Connected to app: ${app.appId}`);
+  }
 
-    // 4. Create or get volume for persistent output storage
-    const volume = await modal.volumes.fromName(volumeName, {
-      createIfMissing: true,
-    });
-    if (verbose) {
-      console.log(`[Modal] Volume ready: ${volumeName}`);
-    }
+  // 2b. Get API key secret (secure way - not via env vars). Looked up before
+  // anything else is provisioned, so a missing secret fails immediately.
+  let secret: Awaited<ReturnType<ModalClient['secrets']['fromName']>>;
+  try {
+    secret = await modal.secrets.fromName('anthropic-api-key');
+  } catch (error: any) {
+    throw new Error(
+      `Modal secret 'anthropic-api-key' could not be loaded (${error.message}). ` +
+        'Create it with: modal secret create anthropic-api-key ANTHROPIC_API_KEY=sk-ant-...'
+    );
+  }
+  if (verbose) {
+    console.log(`[Modal] Loaded secret: anthropic-api-key`);
+  }
 
-    // 4b. Get API key secret (secure way - not via env vars)
-    // Note: Secret must be created first with: modal secret create anthropic-api-key ANTHROPIC_API_KEY=sk-ant-...
-    const secret = await modal.secrets.fromName('anthropic-api-key');
-    if (verbose) {
-      console.log(`[Modal] Loaded secret: anthropic-api-key`);
-    }
+  // 3. Get the container image with Node.js and required dependencies
+  const image = await getGeneratorImage(modal, app);
 
-    // 5. Create sandbox with configuration
-    const sb = await modal.sandboxes.create(app, image, {
-      name: `sap-gen-${request.customerName}`, // Named sandbox - ensures one per customer
+  // 4. Create or get volume for persistent output storage
+  const volume = await modal.volumes.fromName(volumeName, {
+    createIfMissing: true,
+  });
+  if (verbose) {
+    console.log(`[Modal] Volume ready: ${volumeName}`);
+  }
+
+  // 5. Reuse a warm sandbox with this name, or create one
+  const { sandbox, reused, owned } = await getOrCreateSandbox(
+    modal,
+    app,
+    image,
+    {
+      name,
       volumes: { '/output': volume },
-      timeoutMs: timeout,
+      timeoutMs: lifetime,
       idleTimeoutMs: idleTimeout,
       workdir: '/workspace',
-      secrets: [secret], // Secure API key injection
+      // Secure API key injection: the secret is exported as ANTHROPIC_API_KEY
+      // in the sandbox environment, which every exec (including the worker)
+      // inherits - never pass the key through `env` or the command line
+      secrets: [secret],
       env: {
         NODE_ENV: 'production',
       },
       verbose,
-    });
+    },
+    { minLifetime: timeout, shared: keepWarm }
+  );
 
-    console.log(`[Modal] Sandbox created: ${sb.sandboxId}`);
-    console.log(`[Modal] Name: sap-gen-${request.customerName}`);
-    console.log(`[Modal] Timeout: ${timeout / 1000}s, Idle timeout: ${idleTimeout / 1000}s`);
+  console.log(`[Modal] Sandbox ${reused ? 'reused (warm)' : 'created'}: ${sandbox.sandboxId}`);
+  console.log(`[Modal] Name: ${owned ? '(private)' : name}`);
+  if (!reused) {
+    console.log(`[Modal] Timeout: ${lifetime / 1000}s, Idle timeout: ${idleTimeout / 1000}s`);
+  }
+
+  return { sandbox, reused, owned };
+}
+
+/**
+ * Run one request on the sandbox's worker (the one for `workerSlot`, if
+ * given), passing its config file contents along with the job, so no
+ * upload process is spawned per file. Fails when the worker has no result
+ * within `timeout`. Returns the session ID, the generated file paths and
+ * the job log path, all relative to the volume root.
+ */
+async function runGeneration(
+  sb: ModalSandbox,
+  request: GenerateEndpointRequest,
+  configContents: Record<string, string>,
+  options: { timeout: number; onLog?: (line: string) => void; signal?: AbortSignal; workerSlot?: string }
+): Promise<WorkerResult> {
+  // Run SAP generation
+  console.log(`[Modal] Generating SAP code for ${request.customerName}...`);
+
+  const worker = await SandboxWorker.forSandbox(sb, options.workerSlot);
+
+  // Output directory points to the mounted volume
+  console.log('[Modal] Generation output:');
+  const generation = await worker.generate(
+    {
+      ...request,
+      outputDir: '/output',
+    },
+    configContents,
+    { timeoutMs: options.timeout, onLog: options.onLog, signal: options.signal }
+  );
+
+  console.log('[Modal] ✓ Generation complete');
+  console.log(`[Modal] ✓ Generated ${generation.files.length} files`);
+  return generation;
+}
+
+/**
+ * Generate SAP endpoint using Modal Sandbox for isolation
+ */
+export async function generateWithModalSandbox(
+  request: GenerateEndpointRequest,
+  options: ModalGenerationOptions = {}
+): Promise<ModalGenerationResult> {
+  const {
+    timeout = 30 * 60 * 1000, // 30 minutes default
+    idleTimeout = 10 * 60 * 1000, // 10 minutes idle timeout (warm window)
+    maxLifetime = 2 * 60 * 60 * 1000, // 2 hours warm sandbox lifetime
+    verbose = false,
+    volumeName = 'sap-generated-code',
+    keepWarm = true,
+    force = false,
+    onLog,
+    signal,
+  } = options;
+
+  console.log(`[Modal] Starting SAP generation for ${request.customerName}`);
+
+  try {
+    assertValidCustomerName(request.customerName);
+
+    const { sandbox: sb, owned } = await openGeneratorSandbox(
+      `sap-gen-${request.customerName}`, // Named sandbox - ensures one per customer
+      { timeout, idleTimeout, maxLifetime, verbose, volumeName, keepWarm }
+    );
 
-    // 5b. Tag sandbox for organization and filtering
+    // Tag sandbox for organization and filtering
     await sb.setTags({
       customer: request.customerName,
       sap_version: request.sapVersion,
@@ -132,161 +1017,334 @@ export async function generateWithModalSandbox(
       // Option B: Copy files directly (for this example)
       // Note: Modal Sandboxes support file uploads via the API
 
-      // 7. Install dependencies
-      console.log('[Modal] Installing dependencies...');
-      const npmInstall = await sb.exec(['npm', 'install'], {
-        timeoutMs: 5 * 60 * 1000, // 5 minutes for npm install
+      // 7-11. Serve from cache, or install/build (skipped when the sandbox
+      // is warm), upload config files, run generation and list the output
+      const { sessionId, files, logPath, cached } = await runCachedGeneration(sb, request, {
+        timeout,
+        force,
+        verbose,
+        onLog,
+        signal,
       });
 
-      // Stream npm install output
-      if (verbose) {
-        for await (const line of npmInstall.stdout) {
-          process.stdout.write(`  [npm] ${line}`);
-        }
-      }
-
-      const installExitCode = await npmInstall.wait();
-      if (installExitCode !== 0) {
-        throw new Error(`npm install failed with exit code ${installExitCode}`);
+      // 12. Volume persists! A shared sandbox must commit explicitly, since
+      // it won't be terminated now
+      if (!owned) {
+        await commitVolume(sb);
       }
-      console.log('[Modal] ✓ Dependencies installed');
-
-      // 8. Build the project
-      console.log('[Modal] Building project...');
-      const npmBuild = await sb.exec(['npm', 'run', 'build'], {
-        timeoutMs: 2 * 60 * 1000, // 2 minutes for build
-      });
+      console.log('[Modal] Files saved to persistent volume:', volumeName);
 
-      const buildExitCode = await npmBuild.wait();
-      if (buildExitCode !== 0) {
-        throw new Error(`npm build failed with exit code ${buildExitCode}`);
+      return {
+        success: true,
+        sessionId,
+        files,
+        logPath,
+        sandboxId: sb.sandboxId,
+        cached,
+      };
+    } finally {
+      // 13. Terminate a private sandbox; a shared one stays warm for the next
+      // request (and may be running other requests right now)
+      if (owned) {
+        console.log('[Modal] Terminating sandbox...');
+        forgetSandbox(sb);
+        await sb.terminate();
+        console.log('[Modal] ✓ Sandbox terminated (volume data persists)');
+      } else if (keepWarm) {
+        console.log(`[Modal] ✓ Sandbox kept warm (idle timeout: ${idleTimeout / 1000}s)`);
+      } else {
+        // Someone else's warm sandbox: stop our worker so it can idle out
+        await SandboxWorker.release(sb);
+        console.log('[Modal] ✓ Worker released (sandbox left to idle out)');
       }
-      console.log('[Modal] ✓ Build complete');
-
-      // 9. Write config files to sandbox using stdin (safer than heredoc)
-      console.log('[Modal] Writing configuration files...');
+    }
+  } catch (error: any) {
+    console.error('[Modal] Error:', error.message);
+    return {
+      success: false,
+      error: error.message,
+    };
+  }
+}
 
-      // Create config directory in sandbox
-      const mkdir = await sb.exec(['mkdir', '-p', '/workspace/config']);
-      await mkdir.wait();
+export type ModalGenerationEvent =
+  | { type: 'log'; line: string }
+  | { type: 'session'; sessionId: string }
+  | { type: 'result'; result: ModalGenerationResult };
 
-      const configPaths: string[] = [];
+/**
+ * Generate SAP endpoint using Modal Sandbox, streaming progress as it happens
+ *
+ * Yields each line of generation output as a `log` event, a `session` event
+ * as soon as the session ID is printed, and finally a single `result` event.
+ * Callers see progress within a second instead of waiting for the whole run.
+ *
+ * Events are buffered only while the consumer is behind. Stopping iteration
+ * before the result (or aborting `options.signal`) cancels the generation.
+ */
+export async function* streamWithModalSandbox(
+  request: GenerateEndpointRequest,
+  options: ModalGenerationOptions = {}
+): AsyncGenerator<ModalGenerationEvent> {
+  const events: ModalGenerationEvent[] = [];
+  let wake: (() => void) | undefined;
+  let sessionSeen = false;
+  let finished = false;
 
-      // Upload files using base64 encoding (avoids special character issues)
-      for (const filePath of request.configFiles) {
-        const content = fs.readFileSync(filePath, 'utf-8');
-        const basename = path.basename(filePath);
-        const targetPath = `/workspace/config/${basename}`;
-        configPaths.push(targetPath);
+  const controller = new AbortController();
+  const cancel = () => controller.abort();
+  if (options.signal?.aborted) {
+    cancel();
+  }
+  options.signal?.addEventListener('abort', cancel);
 
-        // Base64 encode for binary safety
-        const b64Content = Buffer.from(content).toString('base64');
+  const push = (event: ModalGenerationEvent) => {
+    events.push(event);
+    wake?.();
+  };
 
-        // Write file using base64 decode
-        const writeFile = await sb.exec([
-          'bash',
-          '-c',
-          `echo '${b64Content}' | base64 -d > '${targetPath}'`,
-        ]);
-        const exitCode = await writeFile.wait();
+  // generateWithModalSandbox() reports failures in its result, never rejects
+  void generateWithModalSandbox(request, {
+    ...options,
+    onLog: (line) => {
+      options.onLog?.(line);
+      push({ type: 'log', line });
 
-        if (exitCode !== 0) {
-          throw new Error(`Failed to write ${basename} to sandbox`);
-        }
+      const match = sessionSeen ? null : line.match(/Session ID: (\S+)/);
+      if (match) {
+        sessionSeen = true;
+        push({ type: 'session', sessionId: match[1] });
       }
+    },
+    signal: controller.signal,
+  }).then((result) => push({ type: 'result', result }));
 
-      console.log(`[Modal] ✓ Wrote ${request.configFiles.length} config files`);
-
-      // 10. Run SAP generation
-      console.log('[Modal] Generating SAP code...');
-
-      const customFieldsJson = request.requirements.customFields
-        ? JSON.stringify(request.requirements.customFields)
-        : '{}';
-
-      const cliArgs = [
-        'node',
-        'dist/cli.js',
-        'quote',
-        '--customer',
-        request.customerName,
-        '--sap-version',
-        request.sapVersion,
-        '--config-files',
-        ...configPaths,
-        '--fields',
-        ...request.requirements.quoteFields,
-        '--custom-fields',
-        customFieldsJson,
-      ];
-
-      if (request.requirements.specialLogic) {
-        cliArgs.push('--special-logic', request.requirements.specialLogic);
+  try {
+    while (!finished) {
+      if (events.length === 0) {
+        await new Promise<void>((resolve) => {
+          wake = resolve;
+        });
+        wake = undefined;
+        continue;
       }
 
-      if (request.resume) {
-        cliArgs.push('--resume', request.resume);
-      }
+      const event = events.shift()!;
+      finished = event.type === 'result';
+      yield event;
+    }
+  } finally {
+    options.signal?.removeEventListener('abort', cancel);
+    if (!finished) {
+      // The consumer went away - don't keep generating for nobody
+      cancel();
+      events.length = 0;
+    }
+  }
+}
 
-      if (request.forkSession) {
-        cliArgs.push('--fork');
-      }
+/**
+ * Serialize generation events as newline-delimited JSON
+ */
+async function* toNdjson(events: AsyncIterable<ModalGenerationEvent>): AsyncGenerator<string> {
+  for await (const event of events) {
+    yield JSON.stringify(event) + '\n';
+  }
+}
 
-      // Add output directory pointing to mounted volume
-      cliArgs.push('--output', '/output');
+/**
+ * Generate SAP endpoints for several customers in a single sandbox.
+ *
+ * The sandbox boot, dependency install/build and volume commit are paid once
+ * per batch instead of once per request. Each customer gets its own worker,
+ * so different customers generate in parallel; requests for the same
+ * customer run one after another, since they share an output directory.
+ * Each batch gets its own private sandbox, terminated when the batch is
+ * done, so concurrent batches run in parallel too. Results are returned in
+ * request order; a failing request does not abort the rest of the batch.
+ */
+export async function generateBatchWithModalSandbox(
+  requests: GenerateEndpointRequest[],
+  options: Omit<ModalGenerationOptions, 'keepWarm' | 'maxLifetime'> = {}
+): Promise<ModalGenerationResult[]> {
+  const {
+    timeout = 30 * 60 * 1000, // 30 minutes default (per request)
+    idleTimeout = 10 * 60 * 1000, // 10 minutes idle timeout
+    verbose = false,
+    volumeName = 'sap-generated-code',
+    force = false,
+    onLog,
+  } = options;
 
-      const generation = await sb.exec(cliArgs, {
-        timeoutMs: timeout, // Use sandbox timeout
-      });
+  if (requests.length === 0) {
+    return [];
+  }
 
-      // Stream generation output
-      console.log('[Modal] Generation output:');
-      for await (const line of generation.stdout) {
-        console.log(`  ${line.trimEnd()}`);
-      }
+  console.log(`[Modal] Starting batch SAP generation for ${requests.length} customers`);
 
-      const exitCode = await generation.wait();
-      if (exitCode !== 0) {
-        const stderr = await generation.stderr.readText();
-        throw new Error(`Generation failed with exit code ${exitCode}: ${stderr}`);
-      }
+  // Request indices per customer, in request order
+  const byCustomer = new Map<string, number[]>();
+  requests.forEach((request, i) => {
+    byCustomer.set(request.customerName, [...(byCustomer.get(request.customerName) ?? []), i]);
+  });
+  const groups = [...byCustomer.values()];
 
-      console.log('[Modal] ✓ Generation complete');
+  let sb: ModalSandbox;
+  try {
+    ({ sandbox: sb } = await openGeneratorSandbox(undefined, {
+      // Upper bound for the batch: every request of the largest customer
+      // group, once per round of workers
+      timeout:
+        timeout *
+        Math.max(...groups.map((g) => g.length)) *
+        Math.ceil(groups.length / MAX_BATCH_WORKERS),
+      idleTimeout,
+      maxLifetime: 0,
+      verbose,
+      volumeName,
+      keepWarm: false,
+    }));
 
-      // 11. List generated files
-      const ls = await sb.exec(['find', `/output/${request.customerName}`, '-type', 'f']);
-      const filesOutput = await ls.stdout.readText();
-      const files = filesOutput
-        .trim()
-        .split('\n')
-        .filter((f) => f)
-        .map((f) => f.replace('/output/', ''));
+    await sb.setTags({
+      customer: 'batch',
+      batch_size: String(requests.length),
+      environment: 'production',
+      timestamp: new Date().toISOString(),
+    });
+  } catch (error: any) {
+    console.error('[Modal] Error:', error.message);
+    return requests.map(() => ({ success: false, error: error.message }));
+  }
 
-      console.log(`[Modal] ✓ Generated ${files.length} files`);
+  const results: ModalGenerationResult[] = new Array(requests.length);
 
-      // 12. Volume persists! Files are saved even after sandbox termination
-      console.log('[Modal] Files saved to persistent volume:', volumeName);
+  try {
+    await mapWithConcurrency(groups, MAX_BATCH_WORKERS, async (indices) => {
+      for (const i of indices) {
+        const request = requests[i];
+        try {
+          const { sessionId, files, logPath, cached } = await runCachedGeneration(sb, request, {
+            timeout,
+            force,
+            verbose,
+            onLog,
+            workerSlot: request.customerName,
+          });
+          results[i] = { success: true, sessionId, files, logPath, sandboxId: sb.sandboxId, cached };
+        } catch (error: any) {
+          console.error(`[Modal] Error for ${request.customerName}:`, error.message);
+          results[i] = { success: false, error: error.message, sandboxId: sb.sandboxId };
+        }
+      }
+    });
 
-      return {
-        success: true,
-        files,
-        sandboxId: sb.sandboxId,
-        // Note: We don't have session ID from CLI output in this approach
-        // Would need to parse stdout or modify CLI to output JSON
-      };
-    } finally {
-      // 13. Terminate sandbox
-      console.log('[Modal] Terminating sandbox...');
-      await sb.terminate();
-      console.log('[Modal] ✓ Sandbox terminated (volume data persists)');
+    // One volume commit for the whole batch
+    if (results.some((r) => r.success)) {
+      await commitVolume(sb);
     }
+    console.log('[Modal] Files saved to persistent volume:', volumeName);
   } catch (error: any) {
     console.error('[Modal] Error:', error.message);
-    return {
-      success: false,
-      error: error.message,
-    };
+    // Fail whatever has not completed (or whose output was not committed)
+    return requests.map(() => ({ success: false, error: error.message, sandboxId: sb.sandboxId }));
+  } finally {
+    forgetSandbox(sb);
+    await sb.terminate();
+    console.log('[Modal] ✓ Sandbox terminated (volume data persists)');
   }
+
+  return results;
+}
+
+/**
+ * Create a generate function that coalesces concurrent calls into batches.
+ *
+ * Calls are queued until either `maxBatchSize` requests are waiting or
+ * `waitMs` has passed since the first one arrived, then the whole queue is
+ * run through `runBatch` (generateBatchWithModalSandbox() by default).
+ */
+export function createBatchedGenerator(
+  options: ModalBatchOptions = {},
+  runBatch: typeof generateBatchWithModalSandbox = generateBatchWithModalSandbox
+): (request: GenerateEndpointRequest) => Promise<ModalGenerationResult> {
+  const { maxBatchSize = 8, waitMs = 2000, ...generationOptions } = options;
+
+  let queue: Array<{
+    request: GenerateEndpointRequest;
+    resolve: (result: ModalGenerationResult) => void;
+  }> = [];
+  let timer: NodeJS.Timeout | undefined;
+
+  const flush = () => {
+    if (timer) {
+      clearTimeout(timer);
+      timer = undefined;
+    }
+    const batch = queue;
+    queue = [];
+    if (batch.length === 0) {
+      return;
+    }
+
+    runBatch(
+      batch.map((item) => item.request),
+      generationOptions
+    )
+      .then((results) => {
+        batch.forEach((item, i) => item.resolve(results[i]));
+      })
+      .catch((error: any) => {
+        batch.forEach((item) => item.resolve({ success: false, error: error.message }));
+      });
+  };
+
+  return (request) =>
+    new Promise((resolve) => {
+      queue.push({ request, resolve });
+      if (queue.length >= maxBatchSize) {
+        flush();
+      } else if (!timer) {
+        timer = setTimeout(flush, waitMs);
+      }
+    });
+}
+
+/**
+ * Read the manifest the worker wrote for a customer, or null if there is none
+ * (e.g. output generated before manifests existed).
+ */
+async function readManifest(sb: ModalSandbox, customerName: string): Promise<GenerationManifest | null> {
+  const cat = await sb.exec(['cat', `/output/${customerName}/${MANIFEST_FILENAME}`]);
+  const text = await cat.stdout.readText();
+  if ((await cat.wait()) !== 0) {
+    return null;
+  }
+
+  try {
+    return JSON.parse(text);
+  } catch {
+    return null;
+  }
+}
+
+/**
+ * List a customer's files by walking the volume (fallback without manifest)
+ */
+async function findCustomerFiles(sb: ModalSandbox, customerName: string): Promise<string[]> {
+  const ls = await sb.exec([
+    'find',
+    `/output/${customerName}`,
+    '-type',
+    'f',
+    '!',
+    '-name',
+    '.*', // Manifest and logs
+  ]);
+  const filesOutput = await ls.stdout.readText();
+  return filesOutput
+    .trim()
+    .split('\n')
+    .filter((f) => f);
 }
 
 /**
@@ -295,16 +1353,23 @@ export async function generateWithModalSandbox(
 export async function downloadFromVolume(
   customerName: string,
   volumeName: string = 'sap-generated-code'
-): Promise<{ success: boolean; files?: Map<string, string>; error?: string }> {
+): Promise<{
+  success: boolean;
+  files?: Map<string, string>;
+  manifest?: GenerationManifest;
+  error?: string;
+}> {
   try {
+    assertValidCustomerName(customerName);
+
     const modal = new ModalClient();
 
-    const app = await modal.apps.fromName('sap-endpoint-generator', {
+    const app = await modal.apps.fromName(MODAL_APP_NAME, {
       createIfMissing: true,
     });
 
     const volume = await modal.volumes.fromName(volumeName);
-    const image = modal.images.fromRegistry('node:20-slim');
+    const image = modal.images.fromRegistry(BASE_IMAGE);
 
     // Create a temporary sandbox just to read files
     const sb = await modal.sandboxes.create(app, image, {
@@ -313,26 +1378,28 @@ export async function downloadFromVolume(
     });
 
     try {
-      // List all files
-      const ls = await sb.exec(['find', `/output/${customerName}`, '-type', 'f']);
-      const filesOutput = await ls.stdout.readText();
-      const filePaths = filesOutput
-        .trim()
-        .split('\n')
-        .filter((f) => f);
-
-      // Read each file
-      const files = new Map<string, string>();
-      for (const filePath of filePaths) {
+      // List all files, from the manifest when the worker wrote one
+      const manifest = await readManifest(sb, customerName);
+      const filePaths = manifest
+        ? manifest.files.map((f) => `/output/${f.path}`)
+        : await findCustomerFiles(sb, customerName);
+
+      // Read files concurrently - each read is a round trip to the sandbox,
+      // so overlapping them hides the latency. Results keep listing order.
+      const contents = await mapWithConcurrency(filePaths, MAX_CONCURRENT_EXECS, async (filePath) => {
         const cat = await sb.exec(['cat', filePath]);
-        const content = await cat.stdout.readText();
-        const relativePath = filePath.replace(`/output/${customerName}/`, '');
-        files.set(relativePath, content);
-      }
+        return cat.stdout.readText();
+      });
+
+      const files = new Map<string, string>();
+      filePaths.forEach((filePath, i) => {
+        files.set(filePath.replace(`/output/${customerName}/`, ''), contents[i]);
+      });
 
       return {
         success: true,
         files,
+        manifest: manifest ?? undefined,
       };
     } finally {
       await sb.terminate();
@@ -345,21 +1412,158 @@ export async function downloadFromVolume(
   }
 }
 
+export type ArchiveFormat = 'tar' | 'tar.gz' | 'tar.zst';
+
+const ARCHIVE_FORMATS: readonly ArchiveFormat[] = ['tar', 'tar.gz', 'tar.zst'];
+
+/**
+ * Check untrusted input against the supported formats. An `in` check would
+ * also accept prototype keys such as "toString".
+ */
+export function isArchiveFormat(format: unknown): format is ArchiveFormat {
+  return typeof format === 'string' && (ARCHIVE_FORMATS as readonly string[]).includes(format);
+}
+
+// Compression stage appended to `tar -cf -` for each format
+const ARCHIVE_COMPRESSORS: Record<ArchiveFormat, string> = {
+  tar: '',
+  'tar.gz': ' | gzip -1',
+  'tar.zst': ' | zstd -3 -T0 -q',
+};
+
+/**
+ * Stream a customer's generated code from the Modal Volume as an archive
+ *
+ * The archive is built by tar inside the sandbox and yielded chunk by chunk,
+ * so memory use stays constant regardless of how much code was generated and
+ * callers receive the first bytes as soon as the first file is archived.
+ *
+ * Generated code is a modest amount of text, so the default `tar` skips
+ * compression entirely and the download is bandwidth-bound rather than
+ * CPU-bound. `tar.gz` uses gzip level 1; `tar.zst` uses zstd on all cores.
+ */
+export async function* streamArchiveFromVolume(
+  customerName: string,
+  volumeName: string = 'sap-generated-code',
+  format: ArchiveFormat = 'tar'
+): AsyncGenerator<Uint8Array> {
+  // Validate customer name to prevent path traversal
+  assertValidCustomerName(customerName);
+  if (!isArchiveFormat(format)) {
+    throw new Error(`Unsupported archive format: ${format}`);
+  }
+
+  const modal = new ModalClient();
+
+  const app = await modal.apps.fromName(MODAL_APP_NAME, {
+    createIfMissing: true,
+  });
+
+  const volume = await modal.volumes.fromName(volumeName);
+  let image = modal.images.fromRegistry(BASE_IMAGE);
+  if (format === 'tar.zst') {
+    image = image.dockerfileCommands([
+      'RUN apt-get update && apt-get install -y --no-install-recommends zstd' +
+        ' && rm -rf /var/lib/apt/lists/*',
+    ]);
+  }
+
+  // Create a temporary sandbox just to read files
+  const sb = await modal.sandboxes.create(app, image, {
+    volumes: { '/output': volume },
+    timeoutMs: 5 * 60 * 1000, // 5 minutes
+  });
+
+  try {
+    // Customer name is passed as a positional argument, never interpolated
+    const archive = await sb.exec(
+      [
+        'bash',
+        '-c',
+        `set -o pipefail; test -d "/output/$1" && tar -cf - -C /output "$1"${ARCHIVE_COMPRESSORS[format]}`,
+        'archive',
+        customerName,
+      ],
+      { mode: 'binary' }
+    );
+
+    for await (const chunk of archive.stdout) {
+      yield chunk;
+    }
+
+    const exitCode = await archive.wait();
+    if (exitCode !== 0) {
+      throw new Error(`Failed to archive generated code for ${customerName} (exit code ${exitCode})`);
+    }
+  } finally {
+    await sb.terminate();
+  }
+}
+
+export interface CustomerSummary {
+  name: string;
+  fileCount: number;
+  modifiedAt: string; // ISO timestamp of the customer directory
+}
+
+/**
+ * Parse the output of the single `find` pass used by listCustomers().
+ *
+ * Lines are either `D\t<customer>\t<mtime>` for a top-level customer
+ * directory or `F\t<relative path>` for a file below one.
+ */
+export function parseCustomerListing(output: string): CustomerSummary[] {
+  const summaries = new Map<string, CustomerSummary>();
+  const fileCounts = new Map<string, number>();
+
+  for (const line of output.split('\n')) {
+    const [kind, name, mtime] = line.split('\t');
+    if (kind === 'D' && name) {
+      summaries.set(name, {
+        name,
+        fileCount: 0,
+        modifiedAt: new Date(parseFloat(mtime) * 1000).toISOString(),
+      });
+    } else if (kind === 'F' && name) {
+      const slash = name.indexOf('/');
+      // Files directly under /output don't belong to a customer
+      if (slash > 0) {
+        const customer = name.slice(0, slash);
+        fileCounts.set(customer, (fileCounts.get(customer) ?? 0) + 1);
+      }
+    }
+  }
+
+  return [...summaries.values()]
+    .map((summary) => ({ ...summary, fileCount: fileCounts.get(summary.name) ?? 0 }))
+    .sort((a, b) => a.name.localeCompare(b.name));
+}
+
 /**
  * List all customers with generated code in volume
+ *
+ * Customer directories, their modification times and file counts come from
+ * one `find` traversal; `-type` is answered from the directory entry itself,
+ * so files are counted without a stat() each. Hidden entries such as the
+ * generation cache are skipped.
  */
 export async function listCustomers(
   volumeName: string = 'sap-generated-code'
-): Promise<{ success: boolean; customers?: string[]; error?: string }> {
+): Promise<{
+  success: boolean;
+  customers?: string[];
+  details?: CustomerSummary[];
+  error?: string;
+}> {
   try {
     const modal = new ModalClient();
 
-    const app = await modal.apps.fromName('sap-endpoint-generator', {
+    const app = await modal.apps.fromName(MODAL_APP_NAME, {
       createIfMissing: true,
     });
 
     const volume = await modal.volumes.fromName(volumeName);
-    const image = modal.images.fromRegistry('node:20-slim');
+    const image = modal.images.fromRegistry(BASE_IMAGE);
 
     const sb = await modal.sandboxes.create(app, image, {
       volumes: { '/output': volume },
@@ -367,16 +1571,35 @@ export async function listCustomers(
     });
 
     try {
-      const ls = await sb.exec(['ls', '-1', '/output']);
-      const output = await ls.stdout.readText();
-      const customers = output
-        .trim()
-        .split('\n')
-        .filter((c) => c);
+      const find = await sb.exec([
+        'find',
+        '/output',
+        '-mindepth',
+        '1',
+        '-name',
+        '.*',
+        '-prune',
+        '-o',
+        '-type',
+        'd',
+        '!',
+        '-path',
+        '/output/*/*',
+        '-printf',
+        'D\t%f\t%T@\n',
+        '-o',
+        '-type',
+        'f',
+        '-printf',
+        'F\t%P\n',
+      ]);
+      const output = await find.stdout.readText();
+      const details = parseCustomerListing(output);
 
       return {
         success: true,
-        customers,
+        customers: details.map((d) => d.name),
+        details,
       };
     } finally {
       await sb.terminate();
@@ -389,8 +1612,221 @@ export async function listCustomers(
   }
 }
 
+/**
+ * Yield an already pulled iterator result, then the rest of the iterator
+ */
+async function* prependResult<T>(first: IteratorResult<T>, rest: AsyncIterable<T>): AsyncGenerator<T> {
+  if (!first.done) {
+    yield first.value;
+  }
+  yield* rest;
+}
+
+const ARCHIVE_CONTENT_TYPES: Record<ArchiveFormat, string> = {
+  tar: 'application/x-tar',
+  'tar.gz': 'application/gzip',
+  'tar.zst': 'application/zstd',
+};
+
+/**
+ * Create the HTTP API for Modal deployments
+ *
+ * All operations go through a single `POST /api` endpoint that dispatches on
+ * the `op` field, so clients keep one connection to one host:
+ *
+ *   {"op": "generate", "customer_name": "acme", "sap_version": "ECC6",
+ *    "config_files": {"VBAK.txt": "..."}, "quote_fields": [...], "stream": true}
+ *   {"op": "download", "customer_name": "acme", "format": "tar"}
+ *   {"op": "list"}
+ *
+ * `generate` with `stream: true` responds with newline-delimited JSON
+ * progress events; `download` streams the archive bytes. Other new
+ * generations are coalesced into batches (see createBatchedGenerator(),
+ * configured by `batchOptions`), so concurrent requests share a sandbox.
+ *
+ * Only the route is shared, not a pool of sandboxes: `download` and `list`
+ * each read the volume from a fresh sandbox, since a running sandbox keeps
+ * seeing the volume as it was when the sandbox started.
+ */
+export function createModalApiServer(
+  volumeName: string = 'sap-generated-code',
+  batchOptions: Omit<ModalBatchOptions, 'volumeName'> = {}
+): express.Express {
+  const app = express();
+  app.use(express.json({ limit: '50mb' }));
+  const generateBatched = createBatchedGenerator({ ...batchOptions, volumeName });
+
+  app.get('/health', (_req, res) => {
+    res.json({ status: 'ok' });
+  });
+
+  app.post('/api', async (req, res) => {
+    const { op, customer_name } = req.body ?? {};
+
+    // Validate customer name to prevent path traversal and command injection
+    if (op !== 'list' && (typeof customer_name !== 'string' || !CUSTOMER_NAME_PATTERN.test(customer_name))) {
+      return res.status(400).json({
+        error: 'Invalid customer name. Must be lowercase alphanumeric with optional underscores/hyphens.',
+      });
+    }
+
+    try {
+      switch (op) {
+        case 'generate':
+          return await handleGenerate(req.body, volumeName, generateBatched, res);
+
+        case 'download': {
+          const format = req.body.format ?? 'tar';
+          if (!isArchiveFormat(format)) {
+            return res.status(400).json({ error: `Unsupported archive format: ${format}` });
+          }
+
+          const archive = streamArchiveFromVolume(customer_name, volumeName, format);
+          // Pull the first chunk before sending headers, so a missing customer
+          // still gets a proper error status
+          const first = await archive.next();
+
+          res.setHeader('Content-Type', ARCHIVE_CONTENT_TYPES[format]);
+          res.setHeader('Content-Disposition', `attachment; filename="${customer_name}-code.${format}"`);
+          // pipeline() waits for the client to drain, so a slow download
+          // never buffers the archive in this process
+          return await pipeline(Readable.from(prependResult(first, archive)), res);
+        }
+
+        case 'list': {
+          const result = await listCustomers(volumeName);
+          return res.status(result.success ? 200 : 500).json(result);
+        }
+
+        default:
+          return res.status(400).json({ error: `Unknown op: ${op}. Expected generate, download or list.` });
+      }
+    } catch (error: any) {
+      console.error(`[Modal] ${op} error:`, error);
+      if (res.headersSent) {
+        // Cut the connection, so a truncated download isn't taken as complete
+        return res.destroy();
+      }
+      return res.status(500).json({ error: error.message });
+    }
+  });
+
+  return app;
+}
+
+/**
+ * Handle `op: generate` - write the uploaded config files to a temp dir,
+ * run the generation and respond with the result (or stream progress).
+ *
+ * Streamed, resumed and forced generations run on the customer's own
+ * sandbox; everything else goes through `generateBatched`.
+ */
+async function handleGenerate(
+  body: any,
+  volumeName: string,
+  generateBatched: (request: GenerateEndpointRequest) => Promise<ModalGenerationResult>,
+  res: express.Response
+): Promise<express.Response | void> {
+  const {
+    customer_name,
+    sap_version,
+    config_files,
+    quote_fields,
+    custom_fields,
+    special_logic,
+    resume_session_id,
+    fork_session,
+    force,
+    stream,
+  } = body;
+
+  if (!sap_version || !config_files || !quote_fields) {
+    return res.status(400).json({
+      error: 'Missing required fields: customer_name, sap_version, config_files, quote_fields',
+    });
+  }
+
+  // JSON bodies can carry any type - check shapes before anything is written
+  if (
+    typeof config_files !== 'object' ||
+    Array.isArray(config_files) ||
+    !Object.values(config_files).every((content) => typeof content === 'string')
+  ) {
+    return res.status(400).json({ error: 'config_files must be an object mapping file names to contents' });
+  }
+  if (!Array.isArray(quote_fields) || !quote_fields.every((field) => typeof field === 'string')) {
+    return res.status(400).json({ error: 'quote_fields must be an array of strings' });
+  }
+
+  // Create temp directory for config files
+  const tempDir = fs.mkdtempSync(path.join(os.tmpdir(), 'sap-modal-'));
+
+  try {
+    const configPaths: string[] = [];
+
+    // Write config files (sanitize filenames to prevent path traversal)
+    for (const [filename, content] of Object.entries<string>(config_files)) {
+      const safeFilename = path.basename(filename);
+      if (safeFilename !== filename) {
+        return res.status(400).json({
+          error: `Invalid filename: ${filename} (path traversal attempt detected)`,
+        });
+      }
+
+      const filepath = path.join(tempDir, safeFilename);
+      fs.writeFileSync(filepath, content);
+      configPaths.push(filepath);
+    }
+
+    const request: GenerateEndpointRequest = {
+      customerName: customer_name,
+      sapVersion: sap_version as SAPVersion,
+      configFiles: configPaths,
+      requirements: {
+        quoteFields: quote_fields,
+        customFields: custom_fields,
+        specialLogic: special_logic,
+      },
+      resume: resume_session_id,
+      forkSession: fork_session,
+    };
+    // Stop working for a client that disconnected. 'close' also fires after
+    // a complete response, when there is nothing left to cancel.
+    const controller = new AbortController();
+    res.on('close', () => controller.abort());
+    const options: ModalGenerationOptions = { volumeName, force: Boolean(force), signal: controller.signal };
+
+    if (!stream) {
+      const result =
+        request.resume || options.force
+          ? await generateWithModalSandbox(request, options)
+          : await generateBatched(request);
+      return res.status(result.success ? 200 : 500).json(result);
+    }
+
+    // Newline-delimited JSON progress events
+    res.setHeader('Content-Type', 'application/x-ndjson');
+    res.setHeader('Cache-Control', 'no-cache');
+    res.setHeader('X-Accel-Buffering', 'no'); // Disable nginx buffering
+
+    // pipeline() waits for the client to drain, and ends the event stream
+    // (cancelling the generation) if the client goes away
+    return await pipeline(Readable.from(toNdjson(streamWithModalSandbox(request, options))), res);
+  } finally {
+    // Clean up temp files
+    fs.rmSync(tempDir, { recursive: true, force: true });
+  }
+}
+
 // CLI entry point for Modal deployment
-if (require.main === module) {
+if (require.main === module && process.argv[2] === 'serve') {
+  const port = parseInt(process.argv[3] || process.env.PORT || '3000');
+
+  createModalApiServer().listen(port, () => {
+    console.log(`🚀 SAP Endpoint Generator - Modal API running on http://localhost:${port}`);
+    console.log('   POST /api  {"op": "generate" | "download" | "list", ...}');
+  });
+} else if (require.main === module) {
   const customerName = process.argv[2] || 'test-customer';
   const sapVersion = (process.argv[3] as SAPVersion) || 'ECC6';
 
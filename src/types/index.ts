@@ -61,6 +61,24 @@ export interface GenerateEndpointRequest {
   forkSession?: boolean;  // Whether to fork (true) or continue (false) the session
 }
 
+export interface GeneratedFileEntry {
+  path: string;   // Relative to the output directory, e.g. "acme/analysis.json"
+  size: number;   // Bytes
+  mtime: string;  // ISO timestamp
+}
+
+export interface GenerationManifest {
+  customer: string;
+  sessionId?: string;
+  generatedAt: string;
+  files: GeneratedFileEntry[];
+}
+
+// Files the generation worker writes next to each customer's generated code
+export const MANIFEST_FILENAME = '.manifest.json';      // GenerationManifest, so readers needn't walk the tree
+export const GENERATION_LOG_FILENAME = '.generation.log'; // Log of the most recent job
+export const SESSION_ID_FILENAME = '.session_id';         // Session ID of the most recent job
+
 export interface ValidationResult {
   isValid: boolean;
   errors: string[];
@@ -0,0 +1,249 @@
+/**
+ * SAP Endpoint Generator - Long-lived Generation Worker
+ *
+ * Reads newline-delimited JSON jobs on stdin and writes JSON messages for each
+ * job on stdout: any number of log lines, then one result or error. This lets
+ * a sandbox keep a single Node process (with the SDK already loaded) alive
+ * across generations instead of spawning the CLI per job.
+ *
+ * Job:    {"id": 1, "request": { ...GenerateEndpointRequest }, "configContents": {"VBAK.txt": "..."}}
+ * Log:    {"id": 1, "type": "log", "line": "Starting code generation..."}
+ * Result: {"id": 1, "type": "result", "sessionId": "...", "files": ["acme/analysis.json"], "logPath": "..."}
+ * Error:  {"id": 1, "type": "error", "error": "...", "logPath": "acme/.generation.log"}
+ *
+ * When `configContents` is given, the worker writes those files itself and
+ * uses them as the request's config files, so callers don't need to upload
+ * them separately. After each generation the worker writes a manifest of the
+ * customer's output (see MANIFEST_FILENAME).
+ *
+ * Log lines travel on stdout with the job's result, so a reader sees every
+ * line of a job before its result. Each job's log output is also written to a
+ * file next to the generated code (see GENERATION_LOG_FILENAME), so a run can
+ * be inspected after the fact without anyone holding on to its output.
+ */
+
+import * as readline from 'readline';
+import * as fs from 'fs';
+import * as os from 'os';
+import * as path from 'path';
+import * as util from 'util';
+import { generateQuoteEndpoint } from './index';
+import {
+  GenerateEndpointRequest,
+  GeneratedFileEntry,
+  GenerationManifest,
+  GENERATION_LOG_FILENAME,
+  MANIFEST_FILENAME,
+  SESSION_ID_FILENAME,
+} from './types';
+
+export interface WorkerJob {
+  id: number;
+  request: GenerateEndpointRequest;
+  configContents?: Record<string, string>; // filename -> content
+}
+
+export interface WorkerResult {
+  sessionId?: string;
+  files: string[]; // Relative to the output directory
+  logPath?: string; // Job log, relative to the output directory
+}
+
+export type WorkerMessage =
+  | { id: number; type: 'log'; line: string }
+  | ({ id: number; type: 'result' } & WorkerResult)
+  | { id: number; type: 'error'; error: string; logPath?: string };
+
+/**
+ * Error carrying the path of the job log, so callers can point at it
+ */
+class JobError extends Error {
+  constructor(message: string, readonly logPath: string) {
+    super(message);
+  }
+}
+
+/**
+ * Collect path, size and mtime of every file under `dir` in one walk.
+ * Paths are relative to `root`; hidden files (manifest, logs) are skipped.
+ */
+function collectFileEntries(dir: string, root: string): GeneratedFileEntry[] {
+  if (!fs.existsSync(dir)) {
+    return [];
+  }
+
+  const entries: GeneratedFileEntry[] = [];
+  for (const entry of fs.readdirSync(dir, { withFileTypes: true })) {
+    const fullPath = path.join(dir, entry.name);
+    if (entry.isDirectory()) {
+      entries.push(...collectFileEntries(fullPath, root));
+    } else if (entry.isFile() && !entry.name.startsWith('.')) {
+      const stats = fs.statSync(fullPath);
+      entries.push({
+        path: path.relative(root, fullPath),
+        size: stats.size,
+        mtime: stats.mtime.toISOString(),
+      });
+    }
+  }
+  return entries;
+}
+
+/**
+ * Write the manifest for a customer's output directory and return it
+ */
+function writeManifest(outputDir: string, customerName: string, sessionId?: string): GenerationManifest {
+  const customerDir = path.join(outputDir, customerName);
+  const manifest: GenerationManifest = {
+    customer: customerName,
+    sessionId,
+    generatedAt: new Date().toISOString(),
+    files: collectFileEntries(customerDir, outputDir),
+  };
+
+  if (fs.existsSync(customerDir)) {
+    fs.writeFileSync(path.join(customerDir, MANIFEST_FILENAME), JSON.stringify(manifest, null, 2));
+  }
+  return manifest;
+}
+
+/**
+ * Run a single job, writing its config files to a temp directory first.
+ * Everything logged during the job is passed to `log` line by line and
+ * appended to the customer's generation log.
+ */
+async function runJob(job: WorkerJob, log: (line: string) => void): Promise<WorkerResult> {
+  // Fail before writing anything or starting a session
+  if (!process.env.ANTHROPIC_API_KEY) {
+    throw new Error('ANTHROPIC_API_KEY is not set (is the anthropic-api-key secret attached?)');
+  }
+
+  const request = { ...job.request };
+  const outputDir = request.outputDir || './output';
+  const customerDir = path.join(outputDir, request.customerName);
+  const logPath = path.join(request.customerName, GENERATION_LOG_FILENAME);
+  let tempDir: string | undefined;
+
+  fs.mkdirSync(customerDir, { recursive: true });
+  const logFd = fs.openSync(path.join(outputDir, logPath), 'w');
+  const { error } = console;
+  console.error = (...args: unknown[]) => {
+    const text = util.format(...args);
+    fs.writeSync(logFd, text + '\n');
+    text.split('\n').forEach(log);
+  };
+
+  try {
+    if (job.configContents) {
+      tempDir = fs.mkdtempSync(path.join(os.tmpdir(), 'sap-worker-'));
+      const configPaths: string[] = [];
+
+      // Write config files (sanitize filenames to prevent path traversal)
+      for (const [filename, content] of Object.entries(job.configContents)) {
+        const safeFilename = path.basename(filename);
+        if (safeFilename !== filename) {
+          throw new Error(`Invalid filename: ${filename} (path traversal attempt detected)`);
+        }
+
+        const filepath = path.join(tempDir, safeFilename);
+        fs.writeFileSync(filepath, content);
+        configPaths.push(filepath);
+      }
+
+      request.configFiles = configPaths;
+    }
+
+    const { sessionId } = await generateQuoteEndpoint(request);
+
+    if (sessionId) {
+      fs.writeFileSync(path.join(customerDir, SESSION_ID_FILENAME), sessionId);
+    }
+    const manifest = writeManifest(outputDir, request.customerName, sessionId);
+
+    return { sessionId, files: manifest.files.map((f) => f.path), logPath };
+  } catch (err: any) {
+    console.error(`Job ${job.id} failed: ${err.message}`);
+    throw new JobError(err.message, logPath);
+  } finally {
+    console.error = error;
+    fs.closeSync(logFd);
+    if (tempDir) {
+      fs.rmSync(tempDir, { recursive: true, force: true });
+    }
+  }
+}
+
+export interface WorkerOptions {
+  idleTimeoutMs?: number; // Stop after this long without a job (default: never)
+}
+
+/**
+ * Process jobs from `input` until it closes, or until no job has arrived
+ * for `idleTimeoutMs`. An idle worker must exit: a running process keeps
+ * its Modal sandbox active, so the sandbox's own idle timeout never fires.
+ *
+ * Generator logging during a job is sent as `log` messages; anything logged
+ * outside a job goes to stderr. Either way `output` only ever carries
+ * protocol messages.
+ */
+export async function runWorker(
+  input: NodeJS.ReadableStream = process.stdin,
+  output: NodeJS.WritableStream = process.stdout,
+  options: WorkerOptions = {}
+): Promise<void> {
+  const { log, info, warn } = console;
+  // Look up console.error on each call, so per-job logging can wrap it
+  console.log = (...args: unknown[]) => console.error(...args);
+  console.info = console.log;
+  console.warn = console.log;
+
+  const send = (message: WorkerMessage) => {
+    output.write(JSON.stringify(message) + '\n');
+  };
+
+  const handleLine = async (line: string) => {
+    if (!line.trim()) {
+      return;
+    }
+
+    let job: WorkerJob;
+    try {
+      job = JSON.parse(line);
+    } catch {
+      send({ id: -1, type: 'error', error: `Invalid job: ${line.slice(0, 100)}` });
+      return;
+    }
+
+    try {
+      const log = (line: string) => send({ id: job.id, type: 'log', line });
+      send({ id: job.id, type: 'result', ...(await runJob(job, log)) });
+    } catch (error: any) {
+      send({ id: job.id, type: 'error', error: error.message, logPath: error.logPath });
+    }
+  };
+
+  const lines = readline.createInterface({ input, crlfDelay: Infinity });
+  let idleTimer: NodeJS.Timeout | undefined;
+  const startIdleTimer = () => {
+    if (options.idleTimeoutMs) {
+      idleTimer = setTimeout(() => {
+        console.error(`No job for ${options.idleTimeoutMs! / 1000}s, stopping worker`);
+        lines.close();
+      }, options.idleTimeoutMs);
+    }
+  };
+
+  try {
+    startIdleTimer();
+    for await (const line of lines) {
+      clearTimeout(idleTimer);
+      await handleLine(line);
+      startIdleTimer();
+    }
+  } finally {
+    clearTimeout(idleTimer);
+    console.log = log;
+    console.info = info;
+    console.warn = warn;
+  }
+}
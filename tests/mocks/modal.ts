@@ -0,0 +1,189 @@
+/**
+ * In-memory Jest mock for the `modal` package
+ *
+ * Sandboxes never run anything: every `exec` is answered by `modalFake.exec`,
+ * which tests replace to script the processes they need. By default commands
+ * succeed with no output and `cat` fails, so the volume looks empty.
+ */
+
+type Chunk = string | Uint8Array;
+
+/**
+ * Output stream of a fake process, fed by the test
+ */
+export class FakeStream implements AsyncIterable<Chunk> {
+  private chunks: Chunk[] = [];
+  private ended = false;
+  private wake?: () => void;
+
+  push(...chunks: Chunk[]): this {
+    this.chunks.push(...chunks);
+    this.wake?.();
+    return this;
+  }
+
+  end(): this {
+    this.ended = true;
+    this.wake?.();
+    return this;
+  }
+
+  async *[Symbol.asyncIterator](): AsyncIterator<Chunk> {
+    while (true) {
+      while (this.chunks.length > 0) {
+        yield this.chunks.shift()!;
+      }
+      if (this.ended) {
+        return;
+      }
+      await new Promise<void>((resolve) => {
+        this.wake = resolve;
+      });
+      this.wake = undefined;
+    }
+  }
+
+  async readText(): Promise<string> {
+    let text = '';
+    for await (const chunk of this) {
+      text += typeof chunk === 'string' ? chunk : Buffer.from(chunk).toString();
+    }
+    return text;
+  }
+}
+
+export class FakeProcess {
+  readonly stdout = new FakeStream();
+  readonly stderr = new FakeStream();
+  readonly stdin = {
+    writeText: async (text: string) => this.onInput(text),
+    close: async () => {
+      this.stdinClosed = true;
+    },
+  };
+  stdinClosed = false;
+  private exitCode?: number;
+  private exitWaiters: Array<(code: number) => void> = [];
+
+  constructor(private readonly onInput: (text: string) => void = () => undefined) {}
+
+  /**
+   * End both streams and report `code` from wait()
+   */
+  exit(code: number): this {
+    this.stdout.end();
+    this.stderr.end();
+    this.exitCode = code;
+    this.exitWaiters.forEach((resolve) => resolve(code));
+    return this;
+  }
+
+  wait(): Promise<number> {
+    if (this.exitCode !== undefined) {
+      return Promise.resolve(this.exitCode);
+    }
+    return new Promise((resolve) => this.exitWaiters.push(resolve));
+  }
+}
+
+/**
+ * A process that already printed `stdout` and exited with `code`
+ */
+export function finishedProcess(stdout: Chunk | Chunk[] = [], code: number = 0): FakeProcess {
+  const proc = new FakeProcess();
+  proc.stdout.push(...(Array.isArray(stdout) ? stdout : [stdout]));
+  return proc.exit(code);
+}
+
+export class FakeSandbox {
+  tags: Record<string, string> = {};
+  terminated = false;
+
+  constructor(
+    readonly sandboxId: string,
+    readonly params: Record<string, any>
+  ) {}
+
+  async exec(command: string[], options?: Record<string, unknown>): Promise<FakeProcess> {
+    modalFake.execs.push({ sandbox: this, command });
+    return modalFake.exec(command, this, options);
+  }
+
+  async setTags(tags: Record<string, string>): Promise<void> {
+    this.tags = tags;
+  }
+
+  async poll(): Promise<number | null> {
+    return this.terminated ? 0 : null;
+  }
+
+  async terminate(): Promise<void> {
+    this.terminated = true;
+  }
+}
+
+function defaultExec(command: string[]): FakeProcess {
+  return command[0] === 'cat' ? finishedProcess('', 1) : finishedProcess();
+}
+
+export const modalFake = {
+  sandboxes: [] as FakeSandbox[],
+  execs: [] as Array<{ sandbox: FakeSandbox; command: string[] }>,
+  exec: defaultExec as (command: string[], sandbox: FakeSandbox, options?: Record<string, unknown>) => FakeProcess,
+
+  reset(): void {
+    this.sandboxes = [];
+    this.execs = [];
+    this.exec = defaultExec;
+  },
+};
+
+// Sandbox IDs stay unique across resets, since the code under test may
+// cache per-sandbox state for the lifetime of the module
+let nextSandboxId = 1;
+
+class FakeImage {
+  constructor(readonly imageId: string = 'im-fake') {}
+
+  dockerfileCommands(): FakeImage {
+    return this;
+  }
+
+  async build(): Promise<FakeImage> {
+    return this;
+  }
+}
+
+export class ModalClient {
+  apps = {
+    fromName: async (name: string) => ({ appId: `ap-${name}` }),
+  };
+
+  secrets = {
+    fromName: async (name: string) => ({ secretId: `st-${name}` }),
+  };
+
+  images = {
+    fromRegistry: () => new FakeImage(),
+    fromId: (imageId: string) => new FakeImage(imageId),
+  };
+
+  volumes = {
+    fromName: async (name: string) => ({ volumeId: `vo-${name}` }),
+  };
+
+  sandboxes = {
+    create: async (_app: unknown, _image: unknown, params: Record<string, any> = {}) => {
+      const sandbox = new FakeSandbox(`sb-${nextSandboxId++}`, params);
+      modalFake.sandboxes.push(sandbox);
+      return sandbox;
+    },
+    fromName: async (_appName: string, name: string) => {
+      const sandbox = modalFake.sandboxes.find((sb) => sb.params.name === name && !sb.terminated);
+      if (!sandbox) {
+        throw new Error(`Sandbox not found: ${name}`);
+      }
+      return sandbox;
+    },
+  };
+}
@@ -0,0 +1,580 @@
+/**
+ * Tests for Modal deployment helpers; Modal itself is replaced by the
+ * in-memory fake in tests/mocks/modal.ts
+ */
+
+import {
+  computeGenerationCacheKey,
+  createBatchedGenerator,
+  createModalApiServer,
+  isArchiveFormat,
+  ModalGenerationResult,
+  parseCustomerListing,
+  streamArchiveFromVolume,
+  streamWithModalSandbox,
+} from '../src/modal-deployment';
+import { GenerateEndpointRequest } from '../src/types';
+import { FakeProcess, finishedProcess, modalFake } from './mocks/modal';
+import * as fs from 'fs';
+import * as os from 'os';
+import * as path from 'path';
+import { AddressInfo } from 'net';
+import { Server } from 'http';
+
+jest.mock('modal', () => require('./mocks/modal'));
+
+/**
+ * Answer worker execs with `respond`; every other command behaves as in an
+ * empty sandbox with the project already built
+ */
+function fakeWorker(respond: (job: any, proc: FakeProcess) => void): void {
+  modalFake.exec = (command) => {
+    if (command.includes('worker')) {
+      const proc: FakeProcess = new FakeProcess((text) => respond(JSON.parse(text), proc));
+      return proc;
+    }
+    return command[0] === 'cat' ? finishedProcess('', 1) : finishedProcess();
+  };
+}
+
+const toLines = (messages: object[]) => messages.map((m) => JSON.stringify(m) + '\n').join('');
+
+describe('computeGenerationCacheKey', () => {
+  let tempDir: string;
+  let configFile: string;
+
+  const buildRequest = (overrides: Partial<GenerateEndpointRequest> = {}): GenerateEndpointRequest => ({
+    customerName: 'acme',
+    sapVersion: 'ECC6',
+    configFiles: [configFile],
+    requirements: {
+      quoteFields: ['customer_id', 'quote_date'],
+      customFields: { ZZPRIORITY: 'Priority level', ZZREGION: 'Sales region' },
+      specialLogic: 'Apply VIP discount',
+    },
+    ...overrides,
+  });
+
+  beforeEach(() => {
+    tempDir = fs.mkdtempSync(path.join(os.tmpdir(), 'modal-cache-key-'));
+    configFile = path.join(tempDir, 'VBAK_structure.txt');
+    fs.writeFileSync(configFile, 'Table: VBAK\nVBELN CHAR 10 Sales Document');
+  });
+
+  afterEach(() => {
+    fs.rmSync(tempDir, { recursive: true, force: true });
+  });
+
+  it('should return a sha256 hex digest', () => {
+    expect(computeGenerationCacheKey(buildRequest())).toMatch(/^[0-9a-f]{64}$/);
+  });
+
+  it('should be stable for identical inputs', () => {
+    expect(computeGenerationCacheKey(buildRequest())).toBe(computeGenerationCacheKey(buildRequest()));
+  });
+
+  it('should ignore custom field ordering', () => {
+    const reordered = buildRequest({
+      requirements: {
+        quoteFields: ['customer_id', 'quote_date'],
+        customFields: { ZZREGION: 'Sales region', ZZPRIORITY: 'Priority level' },
+        specialLogic: 'Apply VIP discount',
+      },
+    });
+
+    expect(computeGenerationCacheKey(reordered)).toBe(computeGenerationCacheKey(buildRequest()));
+  });
+
+  it('should change when config file content changes', () => {
+    const before = computeGenerationCacheKey(buildRequest());
+    fs.writeFileSync(configFile, 'Table: VBAK\nVBELN CHAR 12 Sales Document');
+
+    expect(computeGenerationCacheKey(buildRequest())).not.toBe(before);
+  });
+
+  it('should change when the customer or SAP version changes', () => {
+    const base = computeGenerationCacheKey(buildRequest());
+
+    expect(computeGenerationCacheKey(buildRequest({ customerName: 'globex' }))).not.toBe(base);
+    expect(computeGenerationCacheKey(buildRequest({ sapVersion: 'S4HANA' }))).not.toBe(base);
+  });
+});
+
+describe('parseCustomerListing', () => {
+  it('should count files per customer directory', () => {
+    const output = [
+      'D\tacme\t1700000000.5',
+      'F\tacme/Z_CREATE_QUOTE_ACME.abap',
+      'F\tacme/tests/integration_tests.md',
+      'D\tglobex\t1700000100',
+      'F\tglobex/DEPLOYMENT_GUIDE.md',
+      '',
+    ].join('\n');
+
+    expect(parseCustomerListing(output)).toEqual([
+      { name: 'acme', fileCount: 2, modifiedAt: new Date(1700000000500).toISOString() },
+      { name: 'globex', fileCount: 1, modifiedAt: new Date(1700000100000).toISOString() },
+    ]);
+  });
+
+  it('should report customers without files', () => {
+    expect(parseCustomerListing('D\tempty\t1700000000')).toEqual([
+      { name: 'empty', fileCount: 0, modifiedAt: new Date(1700000000000).toISOString() },
+    ]);
+  });
+
+  it('should ignore files directly under the volume root', () => {
+    expect(parseCustomerListing('F\ttest.txt\nD\tacme\t1700000000')).toEqual([
+      { name: 'acme', fileCount: 0, modifiedAt: new Date(1700000000000).toISOString() },
+    ]);
+  });
+});
+
+describe('createBatchedGenerator', () => {
+  const request = (customerName: string): GenerateEndpointRequest => ({
+    customerName,
+    sapVersion: 'ECC6',
+    configFiles: [],
+    requirements: { quoteFields: ['customer_id'] },
+  });
+
+  // Succeeds for every request, echoing the customer name as the session ID
+  const runBatch = jest.fn(async (requests: GenerateEndpointRequest[]) =>
+    requests.map((r): ModalGenerationResult => ({ success: true, sessionId: `session-${r.customerName}` }))
+  );
+
+  beforeEach(() => {
+    jest.useFakeTimers();
+    runBatch.mockClear();
+  });
+
+  afterEach(() => {
+    jest.useRealTimers();
+  });
+
+  it('should flush as soon as the batch is full', async () => {
+    const generate = createBatchedGenerator({ maxBatchSize: 2, waitMs: 60_000 }, runBatch);
+
+    const results = await Promise.all([generate(request('acme')), generate(request('globex'))]);
+
+    expect(runBatch).toHaveBeenCalledTimes(1);
+    expect(runBatch.mock.calls[0][0].map((r) => r.customerName)).toEqual(['acme', 'globex']);
+    expect(results.map((r) => r.sessionId)).toEqual(['session-acme', 'session-globex']);
+  });
+
+  it('should flush a partial batch after waitMs', async () => {
+    const generate = createBatchedGenerator({ maxBatchSize: 8, waitMs: 1000 }, runBatch);
+
+    const pending = generate(request('acme'));
+    jest.advanceTimersByTime(999);
+    expect(runBatch).not.toHaveBeenCalled();
+
+    jest.advanceTimersByTime(1);
+    expect(runBatch).toHaveBeenCalledTimes(1);
+    await expect(pending).resolves.toEqual({ success: true, sessionId: 'session-acme' });
+  });
+
+  it('should start a new batch after a flush', async () => {
+    const generate = createBatchedGenerator({ maxBatchSize: 2, waitMs: 1000 }, runBatch);
+
+    const first = Promise.all([generate(request('acme')), generate(request('globex'))]);
+    const second = generate(request('initech'));
+    jest.advanceTimersByTime(1000);
+    await Promise.all([first, second]);
+
+    expect(runBatch.mock.calls.map(([requests]) => requests.map((r) => r.customerName))).toEqual([
+      ['acme', 'globex'],
+      ['initech'],
+    ]);
+  });
+
+  it('should pass generation options through to the batch', async () => {
+    const generate = createBatchedGenerator({ maxBatchSize: 1, volumeName: 'custom-volume' }, runBatch);
+
+    await generate(request('acme'));
+
+    expect(runBatch).toHaveBeenCalledWith([request('acme')], { volumeName: 'custom-volume' });
+  });
+
+  it('should fail every request in a batch that throws', async () => {
+    runBatch.mockRejectedValueOnce(new Error('Modal unavailable'));
+    const generate = createBatchedGenerator({ maxBatchSize: 2 }, runBatch);
+
+    const results = await Promise.all([generate(request('acme')), generate(request('globex'))]);
+
+    expect(results).toEqual([
+      { success: false, error: 'Modal unavailable' },
+      { success: false, error: 'Modal unavailable' },
+    ]);
+  });
+});
+
+describe('streamWithModalSandbox', () => {
+  let tempDir: string;
+  let request: GenerateEndpointRequest;
+  const consoleSpies: jest.SpyInstance[] = [];
+
+  beforeEach(() => {
+    modalFake.reset();
+    tempDir = fs.mkdtempSync(path.join(os.tmpdir(), 'modal-stream-'));
+    const configFile = path.join(tempDir, 'VBAK_structure.txt');
+    fs.writeFileSync(configFile, 'Table: VBAK');
+    request = {
+      customerName: 'acme',
+      sapVersion: 'ECC6',
+      configFiles: [configFile],
+      requirements: { quoteFields: ['customer_id'] },
+    };
+    consoleSpies.push(
+      jest.spyOn(console, 'log').mockImplementation(() => {}),
+      jest.spyOn(console, 'error').mockImplementation(() => {})
+    );
+  });
+
+  afterEach(() => {
+    fs.rmSync(tempDir, { recursive: true, force: true });
+    consoleSpies.splice(0).forEach((spy) => spy.mockRestore());
+  });
+
+  const collect = async (req: GenerateEndpointRequest) => {
+    const events = [];
+    for await (const event of streamWithModalSandbox(req)) {
+      events.push(event);
+    }
+    return events;
+  };
+
+  it('should yield every log line and the session ID before the result', async () => {
+    fakeWorker((job, proc) => {
+      const output = toLines([
+        { id: job.id, type: 'log', line: 'Starting code generation...' },
+        { id: job.id, type: 'log', line: 'Session ID: session-1' },
+        {
+          id: job.id,
+          type: 'result',
+          sessionId: 'session-1',
+          files: ['acme/analysis.json'],
+          logPath: 'acme/.generation.log',
+        },
+      ]);
+      // Chunk boundaries fall in the middle of messages
+      proc.stdout.push(output.slice(0, 25), output.slice(25, 90), output.slice(90));
+    });
+
+    const events = await collect(request);
+
+    expect(events).toEqual([
+      { type: 'log', line: 'Starting code generation...' },
+      { type: 'log', line: 'Session ID: session-1' },
+      { type: 'session', sessionId: 'session-1' },
+      {
+        type: 'result',
+        result: expect.objectContaining({
+          success: true,
+          sessionId: 'session-1',
+          files: ['acme/analysis.json'],
+          logPath: 'acme/.generation.log',
+          cached: false,
+        }),
+      },
+    ]);
+  });
+
+  it('should report worker errors in the result', async () => {
+    fakeWorker((job, proc) => {
+      proc.stdout.push(
+        toLines([
+          { id: job.id, type: 'log', line: 'Job failed: boom' },
+          { id: job.id, type: 'error', error: 'boom', logPath: 'acme/.generation.log' },
+        ])
+      );
+    });
+
+    const events = await collect(request);
+
+    expect(events[0]).toEqual({ type: 'log', line: 'Job failed: boom' });
+    expect(events[1]).toEqual({
+      type: 'result',
+      result: { success: false, error: 'Generation failed: boom (log: /output/acme/.generation.log)' },
+    });
+  });
+
+  it('should forward worker stderr line by line', async () => {
+    fakeWorker((job, proc) => {
+      proc.stderr.push('Worker rea', 'dy\nsecond ', 'line\n');
+      proc.stdout.push(toLines([{ id: job.id, type: 'result', files: [] }]));
+    });
+
+    await collect(request);
+
+    expect(console.log).toHaveBeenCalledWith('  Worker ready');
+    expect(console.log).toHaveBeenCalledWith('  second line');
+  });
+
+  it('should fail a job the worker never answers once the timeout expires', async () => {
+    const workers: FakeProcess[] = [];
+    fakeWorker((_job, proc) => {
+      workers.push(proc);
+    });
+
+    const events = [];
+    for await (const event of streamWithModalSandbox(request, { timeout: 50 })) {
+      events.push(event);
+    }
+
+    expect(events).toEqual([
+      { type: 'result', result: { success: false, error: 'Generation timed out after 0.05s' } },
+    ]);
+    // The worker is stopped, so nothing else queues up behind the hung job
+    expect(workers).toHaveLength(1);
+    expect(workers[0].stdinClosed).toBe(true);
+  });
+
+  it('should cancel the generation when the consumer stops iterating', async () => {
+    const workers: FakeProcess[] = [];
+    fakeWorker((job, proc) => {
+      workers.push(proc);
+      proc.stdout.push(toLines([{ id: job.id, type: 'log', line: 'Starting code generation...' }]));
+    });
+
+    for await (const event of streamWithModalSandbox(request)) {
+      expect(event).toEqual({ type: 'log', line: 'Starting code generation...' });
+      break;
+    }
+
+    expect(workers[0].stdinClosed).toBe(true);
+  });
+});
+
+describe('isArchiveFormat', () => {
+  it('should accept the supported formats', () => {
+    expect(['tar', 'tar.gz', 'tar.zst'].every(isArchiveFormat)).toBe(true);
+  });
+
+  it('should reject prototype keys and non-strings', () => {
+    expect(isArchiveFormat('toString')).toBe(false);
+    expect(isArchiveFormat('constructor')).toBe(false);
+    expect(isArchiveFormat('zip')).toBe(false);
+    expect(isArchiveFormat(['tar'])).toBe(false);
+    expect(isArchiveFormat(undefined)).toBe(false);
+  });
+
+  it('should be checked before a sandbox is started', async () => {
+    modalFake.reset();
+
+    await expect(streamArchiveFromVolume('acme', undefined, 'toString' as any).next()).rejects.toThrow(
+      'Unsupported archive format: toString'
+    );
+    expect(modalFake.sandboxes).toHaveLength(0);
+  });
+});
+
+describe('createModalApiServer', () => {
+  let server: Server;
+  let baseUrl: string;
+  const consoleSpies: jest.SpyInstance[] = [];
+
+  beforeAll((done) => {
+    // Two concurrent generations fill a batch; a single one waits briefly
+    server = createModalApiServer(undefined, { maxBatchSize: 2, waitMs: 200 }).listen(0, () => {
+      baseUrl = `http://127.0.0.1:${(server.address() as AddressInfo).port}`;
+      done();
+    });
+  });
+
+  afterAll((done) => {
+    server.close(done);
+  });
+
+  beforeEach(() => {
+    modalFake.reset();
+    consoleSpies.push(
+      jest.spyOn(console, 'log').mockImplementation(() => {}),
+      jest.spyOn(console, 'error').mockImplementation(() => {})
+    );
+  });
+
+  afterEach(() => {
+    consoleSpies.splice(0).forEach((spy) => spy.mockRestore());
+  });
+
+  const post = (body: object) =>
+    fetch(`${baseUrl}/api`, {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify(body),
+    });
+
+  it('should reject unknown operations', async () => {
+    const response = await post({ op: 'delete', customer_name: 'acme' });
+
+    expect(response.status).toBe(400);
+    expect((await response.json()).error).toMatch(/Unknown op: delete/);
+  });
+
+  it('should reject invalid customer names before touching Modal', async () => {
+    const response = await post({ op: 'download', customer_name: "acme'; rm -rf /" });
+
+    expect(response.status).toBe(400);
+    expect(modalFake.sandboxes).toHaveLength(0);
+  });
+
+  it('should reject customer names that are not strings', async () => {
+    const responses = await Promise.all([
+      post({ op: 'download', customer_name: ['acme'] }),
+      post({ op: 'download', customer_name: 42 }),
+    ]);
+
+    expect(responses.map((r) => r.status)).toEqual([400, 400]);
+    expect(modalFake.sandboxes).toHaveLength(0);
+  });
+
+  it('should reject unsupported archive formats', async () => {
+    const response = await post({ op: 'download', customer_name: 'acme', format: 'toString' });
+
+    expect(response.status).toBe(400);
+    expect(modalFake.sandboxes).toHaveLength(0);
+  });
+
+  it('should list customers', async () => {
+    modalFake.exec = () => finishedProcess('D\tacme\t1700000000\nF\tacme/analysis.json\n');
+
+    const response = await post({ op: 'list' });
+
+    expect(response.status).toBe(200);
+    expect(await response.json()).toMatchObject({
+      success: true,
+      customers: ['acme'],
+      details: [{ name: 'acme', fileCount: 1 }],
+    });
+  });
+
+  it('should stream the archive for download', async () => {
+    modalFake.exec = () =>
+      finishedProcess([Buffer.from('tar-part-1,'), Buffer.from('tar-part-2')]);
+
+    const response = await post({ op: 'download', customer_name: 'acme' });
+
+    expect(response.status).toBe(200);
+    expect(response.headers.get('content-type')).toBe('application/x-tar');
+    expect(await response.text()).toBe('tar-part-1,tar-part-2');
+    expect(modalFake.execs[0].command.slice(-2)).toEqual(['archive', 'acme']);
+    expect(modalFake.sandboxes[0].terminated).toBe(true);
+  });
+
+  it('should fail the download with 500 when there is nothing to archive', async () => {
+    modalFake.exec = () => finishedProcess([], 1);
+
+    const response = await post({ op: 'download', customer_name: 'missing' });
+
+    expect(response.status).toBe(500);
+    expect((await response.json()).error).toMatch(/Failed to archive generated code for missing/);
+  });
+
+  it('should run generations', async () => {
+    fakeWorker((job, proc) => {
+      proc.stdout.push(
+        toLines([{ id: job.id, type: 'result', sessionId: 'session-1', files: ['acme/analysis.json'] }])
+      );
+    });
+
+    const response = await post({
+      op: 'generate',
+      customer_name: 'acme',
+      sap_version: 'ECC6',
+      config_files: { 'VBAK_structure.txt': 'Table: VBAK' },
+      quote_fields: ['customer_id'],
+    });
+
+    expect(response.status).toBe(200);
+    expect(await response.json()).toMatchObject({
+      success: true,
+      sessionId: 'session-1',
+      files: ['acme/analysis.json'],
+    });
+    expect(modalFake.execs.some((e) => e.command.includes('worker'))).toBe(true);
+  });
+
+  it('should stream generation progress as NDJSON', async () => {
+    fakeWorker((job, proc) => {
+      proc.stdout.push(
+        toLines([
+          { id: job.id, type: 'log', line: 'Session ID: session-1' },
+          { id: job.id, type: 'result', sessionId: 'session-1', files: [] },
+        ])
+      );
+    });
+
+    const response = await post({
+      op: 'generate',
+      customer_name: 'acme',
+      sap_version: 'ECC6',
+      config_files: { 'VBAK_structure.txt': 'Table: VBAK' },
+      quote_fields: ['customer_id'],
+      stream: true,
+    });
+
+    expect(response.headers.get('content-type')).toMatch(/application\/x-ndjson/);
+    const events = (await response.text())
+      .trim()
+      .split('\n')
+      .map((line) => JSON.parse(line));
+    expect(events.map((e) => e.type)).toEqual(['log', 'session', 'result']);
+    expect(events[2].result).toMatchObject({ success: true, sessionId: 'session-1' });
+  });
+
+  it('should batch concurrent generations into one sandbox', async () => {
+    fakeWorker((job, proc) => {
+      proc.stdout.push(
+        toLines([{ id: job.id, type: 'result', sessionId: `session-${job.request.customerName}`, files: [] }])
+      );
+    });
+
+    const responses = await Promise.all(
+      ['acme', 'globex'].map((customer_name) =>
+        post({
+          op: 'generate',
+          customer_name,
+          sap_version: 'ECC6',
+          config_files: { 'VBAK_structure.txt': 'Table: VBAK' },
+          quote_fields: ['customer_id'],
+        })
+      )
+    );
+
+    expect(await Promise.all(responses.map((r) => r.json()))).toMatchObject([
+      { success: true, sessionId: 'session-acme' },
+      { success: true, sessionId: 'session-globex' },
+    ]);
+    expect(modalFake.sandboxes).toHaveLength(1);
+    expect(modalFake.sandboxes[0].terminated).toBe(true);
+    // One worker per customer, so both generate side by side
+    expect(modalFake.execs.filter((e) => e.command.includes('worker'))).toHaveLength(2);
+  });
+
+  it('should reject generate requests with malformed fields', async () => {
+    const base = {
+      op: 'generate',
+      customer_name: 'acme',
+      sap_version: 'ECC6',
+      config_files: { 'VBAK_structure.txt': 'Table: VBAK' },
+      quote_fields: ['customer_id'],
+    };
+
+    const responses = await Promise.all([
+      post({ ...base, quote_fields: 'customer_id' }),
+      post({ ...base, config_files: ['Table: VBAK'] }),
+      post({ ...base, config_files: { 'VBAK_structure.txt': 42 } }),
+    ]);
+
+    expect(responses.map((r) => r.status)).toEqual([400, 400, 400]);
+    expect(modalFake.sandboxes).toHaveLength(0);
+  });
+
+  it('should reject generate requests with missing fields', async () => {
+    const response = await post({ op: 'generate', customer_name: 'acme', sap_version: 'ECC6' });
+
+    expect(response.status).toBe(400);
+    expect(modalFake.sandboxes).toHaveLength(0);
+  });
+});
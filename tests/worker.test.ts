@@ -0,0 +1,246 @@
+/**
+ * Tests for the long-lived generation worker protocol
+ */
+
+import { PassThrough } from 'stream';
+import * as fs from 'fs';
+import * as os from 'os';
+import * as path from 'path';
+import { runWorker, WorkerMessage } from '../src/worker';
+import { GENERATION_LOG_FILENAME, MANIFEST_FILENAME, SESSION_ID_FILENAME } from '../src/types';
+import { generateQuoteEndpoint } from '../src/index';
+
+jest.mock('../src/index', () => ({
+  generateQuoteEndpoint: jest.fn(),
+}));
+
+const mockGenerate = generateQuoteEndpoint as jest.MockedFunction<typeof generateQuoteEndpoint>;
+
+async function runJobs(lines: string[], { withLogs = false } = {}): Promise<WorkerMessage[]> {
+  const input = new PassThrough();
+  const output = new PassThrough();
+  let written = '';
+  output.on('data', (chunk) => {
+    written += chunk.toString();
+  });
+
+  const done = runWorker(input, output);
+  input.end(lines.join('\n') + '\n');
+  await done;
+
+  return written
+    .trim()
+    .split('\n')
+    .filter((l) => l)
+    .map((l) => JSON.parse(l))
+    .filter((m: WorkerMessage) => withLogs || m.type !== 'log');
+}
+
+describe('runWorker', () => {
+  let outputDir: string;
+  let request: {
+    customerName: string;
+    sapVersion: 'ECC6';
+    configFiles: string[];
+    outputDir: string;
+    requirements: { quoteFields: string[] };
+  };
+
+  const originalApiKey = process.env.ANTHROPIC_API_KEY;
+
+  beforeEach(() => {
+    mockGenerate.mockReset();
+    process.env.ANTHROPIC_API_KEY = 'sk-ant-test';
+    outputDir = fs.mkdtempSync(path.join(os.tmpdir(), 'worker-output-'));
+    request = {
+      customerName: 'acme',
+      sapVersion: 'ECC6',
+      configFiles: ['/workspace/config/acme/VBAK_structure.txt'],
+      outputDir,
+      requirements: { quoteFields: ['customer_id'] },
+    };
+  });
+
+  afterEach(() => {
+    fs.rmSync(outputDir, { recursive: true, force: true });
+    if (originalApiKey === undefined) {
+      delete process.env.ANTHROPIC_API_KEY;
+    } else {
+      process.env.ANTHROPIC_API_KEY = originalApiKey;
+    }
+  });
+
+  it('should write one result line per job', async () => {
+    mockGenerate.mockResolvedValueOnce({ messages: [], result: null, sessionId: 'session-1' });
+    mockGenerate.mockResolvedValueOnce({ messages: [], result: null, sessionId: 'session-2' });
+
+    const messages = await runJobs([
+      JSON.stringify({ id: 1, request }),
+      JSON.stringify({ id: 2, request: { ...request, customerName: 'globex' } }),
+    ]);
+
+    expect(messages).toEqual([
+      { id: 1, type: 'result', sessionId: 'session-1', files: [], logPath: 'acme/.generation.log' },
+      { id: 2, type: 'result', sessionId: 'session-2', files: [], logPath: 'globex/.generation.log' },
+    ]);
+    expect(mockGenerate).toHaveBeenCalledTimes(2);
+    expect(mockGenerate.mock.calls[1][0].customerName).toBe('globex');
+  });
+
+  it('should report generation failures without stopping', async () => {
+    mockGenerate.mockRejectedValueOnce(new Error('API key not configured'));
+    mockGenerate.mockResolvedValueOnce({ messages: [], result: null, sessionId: 'session-2' });
+
+    const messages = await runJobs([JSON.stringify({ id: 1, request }), JSON.stringify({ id: 2, request })]);
+
+    expect(messages).toEqual([
+      { id: 1, type: 'error', error: 'API key not configured', logPath: 'acme/.generation.log' },
+      { id: 2, type: 'result', sessionId: 'session-2', files: [], logPath: 'acme/.generation.log' },
+    ]);
+  });
+
+  it('should list generated files relative to the output directory', async () => {
+    mockGenerate.mockImplementationOnce(async () => {
+      fs.mkdirSync(path.join(outputDir, 'acme', 'tests'), { recursive: true });
+      fs.writeFileSync(path.join(outputDir, 'acme', 'analysis.json'), '{}');
+      fs.writeFileSync(path.join(outputDir, 'acme', 'tests', 'integration_tests.md'), '# Tests');
+      return { messages: [], result: null, sessionId: 'session-1' };
+    });
+
+    const [message] = await runJobs([JSON.stringify({ id: 1, request })]);
+
+    expect(message.type).toBe('result');
+    expect(message.type === 'result' && message.files.sort()).toEqual([
+      path.join('acme', 'analysis.json'),
+      path.join('acme', 'tests', 'integration_tests.md'),
+    ]);
+  });
+
+  it('should write a manifest with file sizes next to the output', async () => {
+    mockGenerate.mockImplementationOnce(async () => {
+      fs.mkdirSync(path.join(outputDir, 'acme'), { recursive: true });
+      fs.writeFileSync(path.join(outputDir, 'acme', 'analysis.json'), '{}');
+      return { messages: [], result: null, sessionId: 'session-1' };
+    });
+
+    // Run twice: the manifest from the first run must not list itself
+    await runJobs([JSON.stringify({ id: 1, request })]);
+    mockGenerate.mockResolvedValueOnce({ messages: [], result: null, sessionId: 'session-2' });
+    const [message] = await runJobs([JSON.stringify({ id: 2, request })]);
+
+    const manifest = JSON.parse(
+      fs.readFileSync(path.join(outputDir, 'acme', MANIFEST_FILENAME), 'utf-8')
+    );
+    expect(manifest.customer).toBe('acme');
+    expect(manifest.sessionId).toBe('session-2');
+    expect(manifest.files).toEqual([
+      { path: path.join('acme', 'analysis.json'), size: 2, mtime: expect.any(String) },
+    ]);
+    expect(message).toMatchObject({ files: [path.join('acme', 'analysis.json')] });
+  });
+
+  it('should write config contents to temp files for the request', async () => {
+    let seenConfig: Record<string, string> = {};
+    let seenPaths: string[] = [];
+    mockGenerate.mockImplementationOnce(async (req) => {
+      seenPaths = req.configFiles;
+      seenConfig = Object.fromEntries(
+        req.configFiles.map((f) => [path.basename(f), fs.readFileSync(f, 'utf-8')])
+      );
+      return { messages: [], result: null, sessionId: 'session-1' };
+    });
+
+    await runJobs([
+      JSON.stringify({ id: 1, request, configContents: { 'VBAK_structure.txt': 'Table: VBAK' } }),
+    ]);
+
+    expect(seenConfig).toEqual({ 'VBAK_structure.txt': 'Table: VBAK' });
+    // Temp config files are cleaned up after the job
+    expect(fs.existsSync(seenPaths[0])).toBe(false);
+  });
+
+  it('should reject config filenames with path traversal', async () => {
+    const messages = await runJobs([
+      JSON.stringify({ id: 1, request, configContents: { '../evil.txt': 'x' } }),
+    ]);
+
+    expect(messages[0]).toMatchObject({ id: 1, type: 'error' });
+    expect(messages[0].type === 'error' && messages[0].error).toMatch(/path traversal/);
+    expect(mockGenerate).not.toHaveBeenCalled();
+  });
+
+  it('should fail fast when the API key is missing', async () => {
+    delete process.env.ANTHROPIC_API_KEY;
+
+    const messages = await runJobs([JSON.stringify({ id: 1, request })]);
+
+    expect(messages).toEqual([
+      { id: 1, type: 'error', error: expect.stringMatching(/ANTHROPIC_API_KEY is not set/) },
+    ]);
+    expect(mockGenerate).not.toHaveBeenCalled();
+  });
+
+  it('should stop after the idle timeout even if input stays open', async () => {
+    const errorSpy = jest.spyOn(console, 'error').mockImplementation(() => {});
+    mockGenerate.mockResolvedValueOnce({ messages: [], result: null, sessionId: 'session-1' });
+    const input = new PassThrough();
+    const output = new PassThrough();
+    const written: string[] = [];
+    output.on('data', (chunk) => written.push(chunk.toString()));
+
+    const done = runWorker(input, output, { idleTimeoutMs: 50 });
+    input.write(JSON.stringify({ id: 1, request }) + '\n');
+    await done;
+
+    // The job still ran; only then did the worker go idle
+    expect(JSON.parse(written.join(''))).toMatchObject({ id: 1, type: 'result' });
+    expect(errorSpy).toHaveBeenCalledWith(expect.stringMatching(/stopping worker/));
+    errorSpy.mockRestore();
+  });
+
+  it('should reject malformed job lines', async () => {
+    const messages = await runJobs(['not json']);
+
+    expect(messages).toHaveLength(1);
+    expect(messages[0]).toMatchObject({ id: -1, type: 'error' });
+    expect(mockGenerate).not.toHaveBeenCalled();
+  });
+
+  it('should send generator logging as log messages before the result', async () => {
+    const stderrSpy = jest.spyOn(console, 'error').mockImplementation(() => {});
+    mockGenerate.mockImplementationOnce(async () => {
+      console.log('Starting code generation...');
+      console.log('Done\nSession ID: session-1');
+      return { messages: [], result: null, sessionId: 'session-1' };
+    });
+
+    const messages = await runJobs([JSON.stringify({ id: 1, request })], { withLogs: true });
+
+    expect(messages).toEqual([
+      { id: 1, type: 'log', line: 'Starting code generation...' },
+      { id: 1, type: 'log', line: 'Done' },
+      { id: 1, type: 'log', line: 'Session ID: session-1' },
+      { id: 1, type: 'result', sessionId: 'session-1', files: [], logPath: 'acme/.generation.log' },
+    ]);
+    // Nothing from the job leaks to stderr
+    expect(stderrSpy).not.toHaveBeenCalled();
+    stderrSpy.mockRestore();
+  });
+
+  it('should write job logs and the session ID next to the output', async () => {
+    const stderrSpy = jest.spyOn(console, 'error').mockImplementation(() => {});
+    mockGenerate.mockImplementationOnce(async () => {
+      console.log('Starting code generation...');
+      console.warn('Retrying tool call', 2);
+      return { messages: [], result: null, sessionId: 'session-1' };
+    });
+
+    await runJobs([JSON.stringify({ id: 1, request })]);
+    stderrSpy.mockRestore();
+
+    expect(fs.readFileSync(path.join(outputDir, 'acme', GENERATION_LOG_FILENAME), 'utf-8')).toBe(
+      'Starting code generation...\nRetrying tool call 2\n'
+    );
+    expect(fs.readFileSync(path.join(outputDir, 'acme', SESSION_ID_FILENAME), 'utf-8')).toBe('session-1');
+  });
+});